@@ -5,6 +5,8 @@ import collections
 import string
 import re
 from english_stats import SORTED_ENGLISH_FREQUENCIES
+from compiled_text import CompiledText
+from language_models import resolve_model
 
 ENGLISH_DICTIONARY_ANALYSIS = set()
 ANALYSIS_DICTIONARY_LOADED = False
@@ -25,22 +27,31 @@ def load_dictionary_for_analysis(filepath="common_words.txt"):
         ENGLISH_DICTIONARY_ANALYSIS = DEFAULT_ANALYSIS_WORDS
     ANALYSIS_DICTIONARY_LOADED = True
 
+def _alpha_only_upper(text):
+    """返回大写的纯字母字符串；预编译文本直接复用其字母序列。"""
+    return text.letters if isinstance(text, CompiledText) else ''.join(filter(str.isalpha, text.upper()))
+
 def get_letter_frequencies(text):
-    """计算文本中字母的出现频率（%）。"""
-    text_alpha_only = ''.join(filter(str.isalpha, text.upper()))
+    """计算文本中字母的出现频率（%）。text 可以是字符串或 CompiledText。"""
+    text_alpha_only = _alpha_only_upper(text)
     if not text_alpha_only: return collections.Counter()
     counts = collections.Counter(text_alpha_only); total = len(text_alpha_only)
     return {char: (count / total) * 100 for char, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)}
 
 def get_ngram_frequencies(text, n=2):
-    """计算文本中N-gram的出现次数。"""
-    text_alpha_only = ''.join(filter(str.isalpha, text.upper()))
+    """计算文本中N-gram的出现次数。text 可以是字符串或 CompiledText。"""
+    text_alpha_only = _alpha_only_upper(text)
     ngrams = collections.Counter()
     for i in range(len(text_alpha_only) - n + 1): ngrams[text_alpha_only[i:i+n]] += 1
     return {ngram: count for ngram, count in sorted(ngrams.items(), key=lambda item: item[1], reverse=True) if count > 0}
 
 def apply_partial_key(ciphertext, partial_key_map):
-    """应用部分密钥进行解密，未知字母用'_'表示。"""
+    """应用部分密钥进行解密，未知字母用'_'表示。ciphertext 可以是字符串或 CompiledText。"""
+    if isinstance(ciphertext, CompiledText):
+        mapped_chars = [partial_key_map.get(cipher_char, "_") for cipher_char in string.ascii_uppercase] + ["_"]
+        output = list(ciphertext.template)
+        for position, code in zip(ciphertext.letter_positions, ciphertext.codes): output[position] = mapped_chars[code]
+        return ''.join(output)
     decrypted_text = ""
     for char_original_case in ciphertext:
         char_upper = char_original_case.upper()
@@ -49,13 +60,14 @@ def apply_partial_key(ciphertext, partial_key_map):
         else: decrypted_text += char_original_case
     return decrypted_text
 
-def generate_frequency_suggestions_data(ciphertext_freq):
-    """根据频率生成初步的密钥替换建议数据。"""
+def generate_frequency_suggestions_data(ciphertext_freq, model=None):
+    """根据频率生成初步的密钥替换建议数据。model 为语言模型或其注册名，None 时使用英文标准频率。"""
     suggestions_data = []
+    sorted_language_freq = SORTED_ENGLISH_FREQUENCIES if model is None else resolve_model(model).get_sorted_letter_frequencies()
     sorted_cipher_freq_list = sorted(ciphertext_freq.items(), key=lambda item: item[1], reverse=True)
     for i, (cipher_char, freq) in enumerate(sorted_cipher_freq_list):
-        if i < len(SORTED_ENGLISH_FREQUENCIES):
-            eng_char, eng_freq = SORTED_ENGLISH_FREQUENCIES[i]
+        if i < len(sorted_language_freq):
+            eng_char, eng_freq = sorted_language_freq[i]
             suggestions_data.append({'cipher': cipher_char, 'plain': eng_char, 'cipher_freq': freq, 'plain_freq': eng_freq})
     return suggestions_data
 
@@ -0,0 +1,91 @@
+# annealing_profiles.py
+# 模拟退火参数档案：按密文字母数分档保存退火日程与适应度权重，求解时按长度自动选用
+# 档案文件由 tune_annealing.py 在合成测试集上调优生成；文件缺失时各档均使用内置默认参数
+
+import os
+import json
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_FILE_PATH = os.path.join(BASE_DIR, "annealing_profiles.json")
+
+SCHEDULE_PARAM_NAMES = ("initial_temperature", "cooling_rate", "min_temperature", "max_iterations_per_run")
+WARM_START_PARAM_NAMES = ("warm_start_temperature_scale",) # 热启动轮次专用的日程参数 (由 tune_annealing.py --initial-key-strategy warm 调优)
+FITNESS_WEIGHT_NAMES = ("mono_weight", "bi_weight", "tri_weight", "quad_weight", "dict_weight")
+LENGTH_BUCKETS = (150, 400, 1000, 2500, None) # 各档的字母数上限 (含)，None 表示不设上限
+
+DEFAULT_PROFILE = { # 与 calculate_fitness 的默认权重及原有固定退火参数一致
+    "initial_temperature": 10.0, "cooling_rate": 0.997, "min_temperature": 0.01, "max_iterations_per_run": 100000,
+    "warm_start_temperature_scale": 0.25, # 热启动时初温为 initial_temperature 的这一比例：起点已接近正确密钥，高温阶段只会把它打散
+    "fitness_weights": {"mono_weight": 0.8, "bi_weight": 0.12, "tri_weight": 0.21, "quad_weight": 0.38, "dict_weight": 0.31},
+}
+
+_PROFILES_LOCK = threading.Lock()
+_LOADED_PROFILES = {} # 档案文件路径 -> [(字母数上限, 档案), ...]
+
+def validate_profile(profile):
+    """校验并规范化档案字典 (缺失的项取默认值)，非法时抛出 ValueError。"""
+    normalized = {name: profile.get(name, DEFAULT_PROFILE[name]) for name in SCHEDULE_PARAM_NAMES}
+    try:
+        normalized["initial_temperature"] = float(normalized["initial_temperature"])
+        normalized["cooling_rate"] = float(normalized["cooling_rate"])
+        normalized["min_temperature"] = float(normalized["min_temperature"])
+        normalized["max_iterations_per_run"] = int(normalized["max_iterations_per_run"])
+    except (TypeError, ValueError): raise ValueError("退火参数必须是数值。")
+    if not 0 < normalized["cooling_rate"] < 1: raise ValueError("cooling_rate 必须在 (0, 1) 之间。")
+    if not 0 < normalized["min_temperature"] < normalized["initial_temperature"]: raise ValueError("温度参数需满足 0 < min_temperature < initial_temperature。")
+    if normalized["max_iterations_per_run"] <= 0: raise ValueError("max_iterations_per_run 必须是正整数。")
+    try: normalized["warm_start_temperature_scale"] = float(profile.get("warm_start_temperature_scale", DEFAULT_PROFILE["warm_start_temperature_scale"]))
+    except (TypeError, ValueError): raise ValueError("warm_start_temperature_scale 必须是数值。")
+    if not 0 < normalized["warm_start_temperature_scale"] <= 1: raise ValueError("warm_start_temperature_scale 必须在 (0, 1] 之间。")
+    if normalized["initial_temperature"] * normalized["warm_start_temperature_scale"] <= normalized["min_temperature"]:
+        raise ValueError("热启动初温 (initial_temperature * warm_start_temperature_scale) 必须高于 min_temperature。")
+    normalized["fitness_weights"] = validate_fitness_weights(profile.get("fitness_weights"), DEFAULT_PROFILE["fitness_weights"])
+    return normalized
+
+def validate_fitness_weights(weights, base_weights=None):
+    """以 base_weights 为基础合并 weights 并校验名称与数值，返回完整的权重字典。"""
+    merged = dict(base_weights or DEFAULT_PROFILE["fitness_weights"])
+    if weights is not None and not isinstance(weights, dict): raise ValueError("fitness_weights 必须是 {权重名: 数值} 形式的字典。")
+    for name, value in (weights or {}).items():
+        if name not in FITNESS_WEIGHT_NAMES: raise ValueError(f"未知的适应度权重: '{name}'。可选: {', '.join(FITNESS_WEIGHT_NAMES)}。")
+        try: merged[name] = float(value)
+        except (TypeError, ValueError): raise ValueError(f"适应度权重 '{name}' 必须是数值。")
+    return merged
+
+def default_profiles():
+    """所有长度档都使用内置默认参数的档案列表。"""
+    return [(max_letters, validate_profile(DEFAULT_PROFILE)) for max_letters in LENGTH_BUCKETS]
+
+def load_profiles(filepath=PROFILES_FILE_PATH, force_reload=False):
+    """读取档案文件，返回按上限升序排列的 [(字母数上限, 档案), ...]；同一文件只读取一次。
+    文件缺失或格式错误时打印警告并使用内置默认参数。"""
+    with _PROFILES_LOCK:
+        if filepath in _LOADED_PROFILES and not force_reload: return _LOADED_PROFILES[filepath]
+        profiles = default_profiles()
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f: entries = json.load(f)["buckets"]
+                loaded = [(entry["max_letters"], validate_profile(entry["profile"])) for entry in entries]
+                if loaded:
+                    profiles = sorted(loaded, key=lambda item: float('inf') if item[0] is None else item[0])
+                    if profiles[-1][0] is not None: profiles.append((None, profiles[-1][1])) # 最长一档兜底
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"退火档案警告：无法读取 '{filepath}' ({e})。将使用内置默认参数。")
+        _LOADED_PROFILES[filepath] = profiles
+        return profiles
+
+def select_profile(num_letters, filepath=PROFILES_FILE_PATH):
+    """按密文字母数选出对应长度档的档案 (返回副本，可自由修改)。"""
+    for max_letters, profile in load_profiles(filepath):
+        if max_letters is None or num_letters <= max_letters:
+            return dict(profile, fitness_weights=dict(profile["fitness_weights"]))
+    return validate_profile(DEFAULT_PROFILE)
+
+def save_profiles(entries, filepath=PROFILES_FILE_PATH):
+    """保存档案文件。entries 为 [{"max_letters": 上限或None, "profile": 档案, ...附加的调优信息}, ...]。"""
+    for entry in entries: entry["profile"] = validate_profile(entry["profile"])
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump({"version": 1, "buckets": entries}, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    with _PROFILES_LOCK: _LOADED_PROFILES.pop(filepath, None)
@@ -0,0 +1,256 @@
+# async_solver.py
+# asyncio 门面：把加密、解密与自动破译任务交给进程池 (或线程池) 执行，返回可等待的结果，
+# 以异步迭代器提供进度流，支持通过任务取消终止破译，并限制单个事件循环上的并发任务数
+
+import os
+import queue
+import functools
+import collections
+import asyncio
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import ngram_tables
+from solver_jobs import init_job_worker, run_job, run_job_in_worker, validate_job_params
+from language_models import register_model_specs
+from result_cache import DEFAULT_CACHE_PATH
+
+DEFAULT_PROGRESS_BUFFER_SIZE = 64 # 每个任务缓存的进度事件上限；消费者跟不上时丢弃最旧的事件，只保留最新进展
+DEFAULT_MAX_PENDING_JOBS = 1000 # 已提交但尚未结束的任务上限 (含正在执行的任务)
+
+class AsyncSolveJob:
+    """一个异步任务。`await job` 得到结果字典；`async for event in job` 逐个取得进度事件，任务结束时迭代停止。
+    等待结果的协程被取消时，任务会在工作进程的下一个检查点终止。"""
+    def __init__(self, solver, job_id, kind, progress_buffer_size):
+        self.solver = solver
+        self.job_id = job_id
+        self.kind = kind
+        self.events_dropped = 0
+        self._events = asyncio.Queue(maxsize=progress_buffer_size)
+        self._result_future = asyncio.get_running_loop().create_future()
+        self._task = None
+
+    def _push_event(self, event):
+        """在事件循环线程中调用：缓冲区已满时丢弃最旧的事件，生产者 (求解进程) 因此永不阻塞。"""
+        if self._events.full():
+            self._events.get_nowait(); self.events_dropped += 1
+        self._events.put_nowait(event)
+
+    def _finish(self, result=None, error=None):
+        if error is not None: self._result_future.set_exception(error)
+        else: self._result_future.set_result(result)
+        self._push_event(None) # 结束标记
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._result_future.done() and self._events.empty(): raise StopAsyncIteration
+        event = await self._events.get()
+        if event is None: raise StopAsyncIteration
+        return event
+
+    async def result(self):
+        """等待并返回结果字典 (与 solver_jobs.run_job 相同)。调用方被取消时同时取消任务。"""
+        try: return await asyncio.shield(self._result_future)
+        except asyncio.CancelledError:
+            self.cancel(); raise
+
+    def __await__(self):
+        return self.result().__await__()
+
+    def cancel(self):
+        """请求取消：尚未开始的任务不再执行，运行中的破译在下一个检查点终止并返回当前最优结果。"""
+        self.solver._request_cancel(self.job_id)
+
+    def done(self):
+        return self._result_future.done()
+
+class AsyncSolver:
+    """异步求解器。用法:
+        async with AsyncSolver(max_concurrency=4) as solver:
+            job = solver.start_solve(ciphertext, num_reruns=3)
+            async for event in job: ...
+            result = await job
+    use_processes 为 True 时在进程池中执行 (N-gram表经共享内存发布，只加载一次)，否则使用线程池。
+    max_concurrency 限制同时在执行器中运行的任务数，其余任务在事件循环中异步等待，不会堆积到执行器队列。
+    max_pending 限制已提交但尚未结束的任务总数：start_solve 在已满时抛出 asyncio.QueueFull，
+    submit_solve、solve、encrypt、decrypt 则异步等待空位。
+    破译前先查询 cache_path 指向的结果缓存 (None 表示不使用缓存)。
+    model_specs 为额外语言模型的规格字符串 (见 language_models.parse_model_spec)，在本进程与各工作进程中注册。"""
+    def __init__(self, max_concurrency=None, use_processes=True, progress_buffer_size=DEFAULT_PROGRESS_BUFFER_SIZE,
+                 table_precision="float64", cache_path=DEFAULT_CACHE_PATH, model_specs=(), max_pending=DEFAULT_MAX_PENDING_JOBS):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        if max_pending < 1: raise ValueError("max_pending 必须为正整数。")
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self.progress_buffer_size = progress_buffer_size
+        self.table_precision = table_precision
+        self.cache_path = cache_path
+        self.model_specs = tuple(model_specs)
+        self.executor = None
+        self._loop = None
+        self._semaphore = None
+        self._jobs = {}
+        self._pending_waiters = collections.deque() # 等待空位的提交者 (事件循环中的 Future)
+        self._cancelled_local = set() # 事件循环内的已取消任务ID；线程模式下直接交给工作线程读取
+        self._cancel_pushes = {} # 进程模式：job_id -> 把取消标记写入管理进程字典的执行器 Future
+        self._cancelled_jobs = None
+        self._job_id_counter = itertools.count(1)
+        self._shared_tables = None; self._manager = None; self._progress_queue = None; self._pump_thread = None
+
+    async def start(self):
+        """创建执行器 (加载模型等阻塞操作在默认线程池中完成，不阻塞事件循环)。"""
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self._loop.run_in_executor(None, self._start_executor)
+        return self
+
+    def _start_executor(self):
+        register_model_specs(self.model_specs) # 线程模式直接使用；进程模式用于提交时校验模型名
+        if not self.use_processes:
+            ngram_tables.init_solver_worker()
+            self._cancelled_jobs = self._cancelled_local
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="async-solver")
+            return
+        self._shared_tables = ngram_tables.create_shared_ngram_tables(precision=self.table_precision)
+        try:
+            mp_context = multiprocessing.get_context("spawn")
+            self._manager = mp_context.Manager()
+            self._cancelled_jobs = self._manager.dict()
+            self._progress_queue = mp_context.Queue()
+            self.executor = ProcessPoolExecutor(max_workers=self.max_concurrency, mp_context=mp_context, initializer=init_job_worker,
+                                                initargs=(self._shared_tables.name, self._progress_queue, self._cancelled_jobs, self.cache_path, self.model_specs))
+        except BaseException: # 启动失败时不留下已发布的共享内存
+            if self._manager is not None: self._manager.shutdown()
+            self._shared_tables.close(); self._shared_tables.unlink(); self._shared_tables = None
+            raise
+        self._pump_thread = threading.Thread(target=self._progress_pump_loop, daemon=True)
+        self._pump_thread.start()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.aclose()
+
+    def _progress_pump_loop(self):
+        """进程模式：把工作进程写入共享队列的进度事件转交给事件循环。"""
+        while True:
+            try: event = self._progress_queue.get(timeout=0.5)
+            except queue.Empty: continue
+            except (EOFError, OSError, ValueError): break
+            if event is None: break # 关闭标记
+            try: self._loop.call_soon_threadsafe(self._dispatch_progress, event)
+            except RuntimeError: break # 事件循环已关闭
+
+    def _dispatch_progress(self, event):
+        job = self._jobs.get(event.get("job_id"))
+        if job is not None and not job.done(): job._push_event(event)
+
+    def _request_cancel(self, job_id):
+        if self._cancelled_jobs is None or job_id not in self._jobs or job_id in self._cancelled_local: return
+        self._cancelled_local.add(job_id)
+        if self.use_processes: # 管理进程代理的每次访问都是同步IPC，放到默认线程池中执行，不阻塞事件循环
+            self._cancel_pushes[job_id] = self._loop.run_in_executor(None, functools.partial(self._cancelled_jobs.__setitem__, job_id, True))
+
+    def _check_submit(self, kind, params):
+        if self.executor is None: raise RuntimeError("AsyncSolver 尚未启动，请先 await start() 或使用 async with。")
+        return validate_job_params(kind, params) # 未注册的模型名、非法数值参数等在提交时即抛出 ValueError
+
+    def _wake_pending_waiter(self):
+        while self._pending_waiters:
+            waiter = self._pending_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None); return
+
+    async def _wait_pending_slot(self):
+        while len(self._jobs) >= self.max_pending:
+            waiter = self._loop.create_future()
+            self._pending_waiters.append(waiter)
+            try: await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled(): self._wake_pending_waiter() # 已分到的空位让给下一个等待者
+                raise
+
+    def _submit(self, kind, params):
+        """在已确认有空位时创建任务。"""
+        job = AsyncSolveJob(self, str(next(self._job_id_counter)), kind, self.progress_buffer_size)
+        self._jobs[job.job_id] = job
+        job._task = self._loop.create_task(self._run_job(job, params))
+        return job
+
+    def _submit_nowait(self, kind, params):
+        params = self._check_submit(kind, params)
+        if len(self._jobs) >= self.max_pending:
+            raise asyncio.QueueFull(f"未结束的任务已达上限 ({self.max_pending})，请稍后重试或改用 submit_solve 等待空位。")
+        return self._submit(kind, params)
+
+    async def _submit_wait(self, kind, params):
+        params = self._check_submit(kind, params)
+        await self._wait_pending_slot()
+        return self._submit(kind, params)
+
+    async def _run_job(self, job, params):
+        try:
+            async with self._semaphore:
+                if job.job_id in self._cancelled_local: # 排队期间已取消，不再占用执行器
+                    if job.kind == "solve":
+                        job._finish(result={"key": "", "plaintext": "", "score": None, "runs_completed": 0, "stop_reason": "cancelled"})
+                    else: job._finish(error=asyncio.CancelledError())
+                    return
+                if self.use_processes:
+                    call = (run_job_in_worker, job.job_id, job.kind, params)
+                else:
+                    def progress_sink(event): self._loop.call_soon_threadsafe(self._dispatch_progress, event)
+                    call = (run_job, job.job_id, job.kind, params, progress_sink, self._cancelled_jobs, self.cache_path)
+                try: result = await self._loop.run_in_executor(self.executor, *call)
+                except Exception as e: job._finish(error=e)
+                else: job._finish(result=result)
+        finally:
+            self._jobs.pop(job.job_id, None)
+            self._wake_pending_waiter()
+            self._cancelled_local.discard(job.job_id)
+            cancel_push = self._cancel_pushes.pop(job.job_id, None)
+            if cancel_push is not None: # 写入完成后再删除，保证管理进程字典中不残留标记
+                await asyncio.gather(cancel_push, return_exceptions=True)
+                await asyncio.gather(self._loop.run_in_executor(None, self._cancelled_jobs.pop, job.job_id, None), return_exceptions=True)
+
+    def start_solve(self, ciphertext, **params):
+        """提交自动破译任务并立即返回 AsyncSolveJob。params 与 solver_jobs.run_job 的 solve 参数相同
+        (user_locked_mappings、num_reruns、time_budget_seconds、model、退火参数等)。
+        未结束的任务已达 max_pending 时抛出 asyncio.QueueFull。"""
+        return self._submit_nowait("solve", dict(params, ciphertext=ciphertext))
+
+    async def submit_solve(self, ciphertext, **params):
+        """与 start_solve 相同，但在未结束的任务已达 max_pending 时等待空位。"""
+        return await self._submit_wait("solve", dict(params, ciphertext=ciphertext))
+
+    async def solve(self, ciphertext, **params):
+        """自动破译并返回结果字典；调用方被取消时终止破译。"""
+        return await (await self.submit_solve(ciphertext, **params))
+
+    async def encrypt(self, text, key):
+        return (await (await self._submit_wait("encrypt", {"text": text, "key": key})))["text"]
+
+    async def decrypt(self, text, key):
+        return (await (await self._submit_wait("decrypt", {"text": text, "key": key})))["text"]
+
+    async def aclose(self):
+        """取消未完成的任务，等待执行器退出并释放共享内存与管理进程。"""
+        if self.executor is None: return
+        for job in list(self._jobs.values()): job.cancel()
+        pending_tasks = [job._task for job in list(self._jobs.values()) if job._task is not None]
+        if pending_tasks: await asyncio.gather(*pending_tasks, return_exceptions=True)
+        await self._loop.run_in_executor(None, self._shutdown_executor)
+
+    def _shutdown_executor(self):
+        self.executor.shutdown(wait=True); self.executor = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None); self._pump_thread.join()
+            self._progress_queue.close()
+        if self._manager is not None: self._manager.shutdown()
+        if self._shared_tables is not None:
+            self._shared_tables.close(); self._shared_tables.unlink()
@@ -4,8 +4,28 @@
 import random
 import string
 import math
-from cipher_logic import decrypt, PLAINTEXT_ALPHABET, validate_key
+import collections
+from cipher_logic import decrypt_compiled, PLAINTEXT_ALPHABET, validate_key
+from compiled_text import compile_text
 from fitness import calculate_fitness
+from language_models import resolve_model, DEFAULT_MODEL_NAME
+from annealing_profiles import select_profile, validate_fitness_weights
+from analysis_helpers import get_letter_frequencies, get_ngram_frequencies, generate_frequency_suggestions_data
+from english_stats import COMMON_BIGRAMS, COMMON_TRIGRAMS
+
+STOP_CHECK_INTERVAL = 200 # 每隔多少次迭代调用一次 stop_check
+INITIAL_KEY_STRATEGIES = ("random", "warm") # random: 完全随机的初始密钥；warm: 由频率与常见N-gram推断的热启动密钥
+WARM_START_PATTERN_RANK_WINDOW = 2 # 密文N-gram与常见N-gram的排名相差不超过此值时才计票
+WARM_START_RANDOMNESS = 0.25 # 热启动评分上叠加的高斯噪声标准差 (频率完全对齐的得分为1)，使多轮运行的起点各不相同
+WARM_START_MIN_TEMPERATURE_RATIO = 10.0 # 按比例降低后的热启动初温至少为末温的这一倍数，保证仍有一段退火过程
+STAGED_SOLVE_MIN_LETTERS = 6000 # 字母数超过此值时自动采用分阶段求解 (抽样退火 -> 逐步扩大窗口精修 -> 全文验证)
+STAGED_SAMPLE_LETTERS = 2000 # 抽样窗口的字母数
+STAGED_SAMPLE_CANDIDATES = 8 # 从多少个均匀分布的候选窗口中挑选抽样窗口
+STAGED_REFINE_GROWTH = 3 # 每个精修阶段窗口扩大的倍数
+STAGED_REFINE_MAX_LETTERS = 18000 # 精修窗口的字母数上限
+STAGED_REFINE_LETTER_BUDGET = 4000000 # 每个精修阶段的 迭代次数×窗口字母数 预算，各阶段耗时因此大致相同
+STAGED_REFINE_INITIAL_TEMPERATURE = 0.01 # 精修从已接近正确的密钥出发，只需低温微调
+STAGED_REFINE_MIN_TEMPERATURE = 0.0001
 
 def generate_random_key():
     """生成一个完全随机的、有效的26字母密钥字符串 (密文序列对应a-z)。"""
@@ -46,6 +66,44 @@ def generate_initial_key_with_locks(user_locked_mappings):
         return generate_random_key()
     return initial_key_str
 
+def warm_start_scores(ciphertext, model=None):
+    """计算热启动评分矩阵 scores[密文编码][明文编码]：
+    密文字母与明文字母的频率排名越接近得分越高 (排名对齐即 generate_frequency_suggestions_data 的建议)；
+    默认英文模型下，密文中最常见的二元组/三元组还按排名与 COMMON_BIGRAMS/COMMON_TRIGRAMS 匹配，为对应位置的字母对投票。"""
+    model = resolve_model(model)
+    compiled_ciphertext = compile_text(ciphertext)
+    suggestions = generate_frequency_suggestions_data(get_letter_frequencies(compiled_ciphertext), model)
+    cipher_ranking = [sug['cipher'] for sug in suggestions if sug['cipher'] in string.ascii_uppercase]
+    cipher_ranking += [char for char in string.ascii_uppercase if char not in cipher_ranking] # 未出现的字母排在最后
+    plain_ranking = [char.upper() for char, _ in model.get_sorted_letter_frequencies()]
+    cipher_rank = {ord(char) - 65: rank for rank, char in enumerate(cipher_ranking)}
+    plain_rank = {ord(char) - 65: rank for rank, char in enumerate(plain_ranking)}
+    scores = [[1.0 / (1 + abs(cipher_rank[c] - plain_rank.get(p, 25))) for p in range(26)] for c in range(26)]
+    if model.name != DEFAULT_MODEL_NAME: return scores # 常见N-gram列表只适用于英文
+    for n, common_ngrams in ((2, COMMON_BIGRAMS), (3, COMMON_TRIGRAMS)):
+        cipher_ngrams = [ngram for ngram in get_ngram_frequencies(compiled_ciphertext, n) if all(char in string.ascii_uppercase for char in ngram)]
+        for cipher_rank_index, cipher_ngram in enumerate(cipher_ngrams[:len(common_ngrams)]):
+            for common_rank_index, common_ngram in enumerate(common_ngrams):
+                rank_distance = abs(cipher_rank_index - common_rank_index)
+                if rank_distance > WARM_START_PATTERN_RANK_WINDOW: continue
+                for cipher_char, plain_char in zip(cipher_ngram, common_ngram):
+                    scores[ord(cipher_char) - 65][ord(plain_char) - 65] += 1.0 / (1 + rank_distance)
+    return scores
+
+def generate_warm_start_key(scores, user_locked_mappings=None, randomness=WARM_START_RANDOMNESS, rng=random):
+    """由热启动评分矩阵生成初始密钥字符串：锁定的映射优先保留，其余按 (评分 + 高斯噪声) 从高到低贪心配对。"""
+    cipher_for_plain = [''] * 26; used_cipher_codes = set()
+    for cipher_char, plain_char in (user_locked_mappings or {}).items():
+        cipher_code, plain_code = ord(cipher_char.upper()) - 65, ord(plain_char.lower()) - 97
+        if 0 <= cipher_code < 26 and 0 <= plain_code < 26 and not cipher_for_plain[plain_code] and cipher_code not in used_cipher_codes:
+            cipher_for_plain[plain_code] = cipher_char.upper(); used_cipher_codes.add(cipher_code)
+    candidate_pairs = sorted(((scores[c][p] + rng.gauss(0, randomness) if randomness > 0 else scores[c][p], c, p)
+                              for c in range(26) for p in range(26)), reverse=True)
+    for _, cipher_code, plain_code in candidate_pairs:
+        if cipher_code in used_cipher_codes or cipher_for_plain[plain_code]: continue
+        cipher_for_plain[plain_code] = string.ascii_uppercase[cipher_code]; used_cipher_codes.add(cipher_code)
+    return "".join(cipher_for_plain)
+
 def modify_key_with_locks(current_key_list, locked_plain_char_indices):
     """修改密钥列表，仅交换那些未被用户锁定的明文字母的映射。"""
     unlocked_indices = [i for i in range(26) if i not in locked_plain_char_indices]
@@ -54,14 +112,96 @@ def modify_key_with_locks(current_key_list, locked_plain_char_indices):
     current_key_list[idx1], current_key_list[idx2] = current_key_list[idx2], current_key_list[idx1]
     return current_key_list
 
+def select_sample_window(compiled_ciphertext, num_letters=STAGED_SAMPLE_LETTERS, num_candidates=STAGED_SAMPLE_CANDIDATES):
+    """在均匀分布的若干候选窗口中，选出字母频率分布与全文最接近 (L1距离最小) 的窗口，返回其起始字母下标。"""
+    codes = compiled_ciphertext.codes; total_letters = len(codes)
+    if total_letters <= num_letters: return 0
+    full_counts = collections.Counter(codes)
+    best_start, best_distance = 0, float('inf')
+    for candidate_index in range(num_candidates):
+        start = (total_letters - num_letters) * candidate_index // max(num_candidates - 1, 1)
+        window_counts = collections.Counter(codes[start:start + num_letters])
+        distance = sum(abs(window_counts.get(code, 0) / num_letters - count / total_letters) for code, count in full_counts.items())
+        if distance < best_distance: best_start, best_distance = start, distance
+    return best_start
+
+def _letter_window(compiled_ciphertext, start, num_letters):
+    """返回从第 start 个字母起、含 num_letters 个字母的原文片段 (保留标点与单词边界) 的预编译形式。"""
+    letter_positions = compiled_ciphertext.letter_positions
+    end = min(start + num_letters, len(letter_positions))
+    return compile_text(compiled_ciphertext.template[letter_positions[start]:letter_positions[end - 1] + 1])
+
+def solve_staged(ciphertext, user_locked_mappings=None, initial_temperature=None, cooling_rate=None, min_temperature=None,
+                 max_iterations_per_run=None, status_callback=None, stop_check=None, model=None, fitness_weights=None,
+                 initial_key_strategy="random"):
+    """分阶段求解长密文 (单轮)，参数与返回值同 solve_simulated_annealing：
+    1. 在字母分布与全文最接近的抽样窗口上完整退火 (显式给出的退火参数作用于此阶段)；
+    2. 以上一阶段的最优密钥为起点，在以抽样窗口为中心、逐步扩大的窗口上低温精修，补全抽样中罕见字母的映射；
+    3. 在全文上计算一次适应度作为最终分数。
+    退火只作用于长度有上限的窗口，单轮耗时因此与全文长度基本无关。"""
+    model = resolve_model(model)
+    compiled_ciphertext = compile_text(ciphertext)
+    total_letters = len(compiled_ciphertext.codes)
+    sample_start = select_sample_window(compiled_ciphertext)
+    window_center = sample_start + STAGED_SAMPLE_LETTERS // 2
+    refine_sizes = []; refine_limit = min(total_letters, STAGED_REFINE_MAX_LETTERS); window_size = STAGED_SAMPLE_LETTERS
+    while window_size < refine_limit:
+        window_size *= STAGED_REFINE_GROWTH
+        if window_size * 1.5 >= refine_limit: window_size = refine_limit # 余下部分不足半档时并入最后一档
+        refine_sizes.append(window_size)
+
+    iteration_offset = 0
+    def forward_status(key_str, decrypted_text, score, iteration, is_final_for_run, status_message):
+        if not is_final_for_run: status_callback(key_str, decrypted_text, score, iteration_offset + iteration, False, status_message)
+    stage_callback = forward_status if status_callback else None
+
+    best_key, _, _ = solve_simulated_annealing(
+        _letter_window(compiled_ciphertext, sample_start, STAGED_SAMPLE_LETTERS), user_locked_mappings,
+        initial_temperature, cooling_rate, min_temperature, max_iterations_per_run, stage_callback, stop_check, model,
+        fitness_weights, initial_key_strategy, staged=False)
+    iteration_offset += max_iterations_per_run or select_profile(STAGED_SAMPLE_LETTERS)["max_iterations_per_run"]
+    stages_completed = [f"抽样 {STAGED_SAMPLE_LETTERS}"]
+    for window_size in refine_sizes:
+        if stop_check is not None and stop_check(): break
+        window_start = max(0, min(window_center - window_size // 2, total_letters - window_size))
+        refine_iterations = max(STAGED_REFINE_LETTER_BUDGET // window_size, 1)
+        best_key, _, _ = solve_simulated_annealing(
+            _letter_window(compiled_ciphertext, window_start, window_size), user_locked_mappings,
+            STAGED_REFINE_INITIAL_TEMPERATURE, (STAGED_REFINE_MIN_TEMPERATURE / STAGED_REFINE_INITIAL_TEMPERATURE) ** (1.0 / refine_iterations),
+            STAGED_REFINE_MIN_TEMPERATURE, refine_iterations, stage_callback, stop_check, model, fitness_weights,
+            initial_key=best_key, staged=False)
+        iteration_offset += refine_iterations; stages_completed.append(f"精修 {window_size}")
+
+    weights = validate_fitness_weights(fitness_weights, select_profile(total_letters)["fitness_weights"]) # 与非分阶段求解的全文分数可比
+    decrypted_text = decrypt_compiled(compiled_ciphertext, best_key)
+    final_score = calculate_fitness(decrypted_text, dictionary_weighting_scheme='linear', model=model, **weights)
+    decrypted_text = decrypted_text.render()
+    if status_callback:
+        status_callback(best_key, decrypted_text, final_score, iteration_offset, True,
+                        f"分阶段求解完成 ({' -> '.join(stages_completed)} -> 全文 {total_letters} 个字母验证)")
+    return best_key, decrypted_text, final_score
+
 def solve_simulated_annealing(ciphertext,
                               user_locked_mappings=None, 
-                              initial_temperature=10.0,
-                              cooling_rate=0.997, 
-                              min_temperature=0.01,
-                              max_iterations_per_run=100000, # 单轮运行的迭代次数
-                              status_callback=None):      # 移除了 stop_event
-    """执行单轮模拟退火算法。"""
+                              initial_temperature=None,   # 退火参数为 None 时取自与密文长度匹配的退火档案
+                              cooling_rate=None, 
+                              min_temperature=None,
+                              max_iterations_per_run=None, # 单轮运行的迭代次数
+                              status_callback=None,       # 移除了 stop_event
+                              stop_check=None,            # 可选的无参可调用对象，返回True时提前结束本轮 (用于任务取消/时间预算)
+                              model=None,                 # 语言模型 (LanguageModel 或注册名)，None 时使用默认英文模型
+                              fitness_weights=None,       # 覆盖档案中的部分适应度权重，如 {"quad_weight": 0.5}
+                              initial_key_strategy="random", # 初始密钥的生成方式，见 INITIAL_KEY_STRATEGIES
+                              initial_key=None,           # 给定时从此密钥出发 (优先于 initial_key_strategy)
+                              staged=None):               # 是否分阶段求解；None 时字母数超过 STAGED_SOLVE_MIN_LETTERS 即自动采用
+    """执行单轮模拟退火算法。ciphertext 可以是字符串或 CompiledText (多轮运行时可复用同一预编译对象)。
+    未显式给出的退火参数与适应度权重按密文字母数从 annealing_profiles 中自动选取。
+    initial_key_strategy 为 "random" (默认) 时从随机密钥出发；为 "warm" 时从频率与常见N-gram推断的密钥出发 (带随机扰动，各轮起点不同)，
+    且未显式给出初温时以档案初温乘 warm_start_temperature_scale 作为初温 (不低于末温的 WARM_START_MIN_TEMPERATURE_RATIO 倍)，
+    降温系数不变，即只走退火日程的低温段。初温不高于末温时抛出 ValueError。
+    很长的密文交给 solve_staged 在抽样窗口上求解，见该函数说明。"""
+    if initial_key_strategy not in INITIAL_KEY_STRATEGIES:
+        raise ValueError(f"未知的初始密钥策略: '{initial_key_strategy}'。可选: {', '.join(INITIAL_KEY_STRATEGIES)}。")
     if not PLAINTEXT_ALPHABET: _ = validate_key("abcdefghijklmnopqrstuvwxyz")
 
     if user_locked_mappings is None: user_locked_mappings = {}
@@ -72,14 +212,34 @@ def solve_simulated_annealing(ciphertext,
             try: locked_plain_indices.append(PLAINTEXT_ALPHABET.index(plain_char_value.lower()))
             except ValueError: pass # 无效的锁定明文字母在GUI层面已校验
 
-    current_key_str = generate_initial_key_with_locks(user_locked_mappings)
+    model = resolve_model(model) # 只解析一次模型句柄，迭代中直接使用模型对象
+    compiled_ciphertext = compile_text(ciphertext) # 每个任务只做一次归一化，迭代中仅代换字母编码
+    if staged is None: staged = initial_key is None and len(compiled_ciphertext.codes) > STAGED_SOLVE_MIN_LETTERS
+    if staged:
+        return solve_staged(compiled_ciphertext, user_locked_mappings, initial_temperature, cooling_rate, min_temperature,
+                            max_iterations_per_run, status_callback, stop_check, model, fitness_weights, initial_key_strategy)
+    profile = select_profile(len(compiled_ciphertext.codes))
+    if min_temperature is None: min_temperature = profile["min_temperature"]
+    if initial_temperature is None:
+        initial_temperature = profile["initial_temperature"]
+        if initial_key is None and initial_key_strategy == "warm": # 显式给出的末温可能高于按比例降低后的初温
+            initial_temperature = max(initial_temperature * profile["warm_start_temperature_scale"], min_temperature * WARM_START_MIN_TEMPERATURE_RATIO)
+    if initial_temperature <= min_temperature:
+        raise ValueError(f"初温 ({initial_temperature:g}) 必须高于末温 ({min_temperature:g})，否则退火不会进行任何迭代。")
+    if cooling_rate is None: cooling_rate = profile["cooling_rate"]
+    if max_iterations_per_run is None: max_iterations_per_run = profile["max_iterations_per_run"]
+    weights = validate_fitness_weights(fitness_weights, profile["fitness_weights"])
+
+    if initial_key is not None: current_key_str = initial_key
+    elif initial_key_strategy == "warm": current_key_str = generate_warm_start_key(warm_start_scores(compiled_ciphertext, model), user_locked_mappings)
+    else: current_key_str = generate_initial_key_with_locks(user_locked_mappings)
     current_key_list_mutable = list(current_key_str)
-    current_decrypted_text = decrypt(ciphertext, current_key_str)
-    current_score = calculate_fitness(current_decrypted_text, dictionary_weighting_scheme='linear') 
+    current_decrypted_text = decrypt_compiled(compiled_ciphertext, current_key_str)
+    current_score = calculate_fitness(current_decrypted_text, dictionary_weighting_scheme='linear', model=model, **weights) 
 
     run_best_key_str = current_key_str
     run_best_score = current_score
-    run_best_decrypted_text = current_decrypted_text
+    run_best_decrypted_text = current_decrypted_text.render()
 
     temperature = initial_temperature
     last_reported_iteration_for_gui = 0 
@@ -92,13 +252,14 @@ def solve_simulated_annealing(ciphertext,
     for i in range(max_iterations_per_run): # 模拟退火主循环
         # 移除了 stop_event 检查
         if temperature < min_temperature: status_message_on_stop_for_run = f"温度已达最低 (单轮 T={temperature:.3f})"; break
+        if stop_check is not None and i % STOP_CHECK_INTERVAL == 0 and stop_check(): status_message_on_stop_for_run = "已提前终止 (单轮)"; break
 
         candidate_key_list_mutable = list(current_key_list_mutable)
         candidate_key_list_mutable = modify_key_with_locks(candidate_key_list_mutable, locked_plain_indices)
         candidate_key_str = "".join(candidate_key_list_mutable)
         
-        candidate_decrypted_text = decrypt(ciphertext, candidate_key_str)
-        candidate_score = calculate_fitness(candidate_decrypted_text, dictionary_weighting_scheme='linear')
+        candidate_decrypted_text = decrypt_compiled(compiled_ciphertext, candidate_key_str)
+        candidate_score = calculate_fitness(candidate_decrypted_text, dictionary_weighting_scheme='linear', model=model, **weights)
 
         delta_score = candidate_score - current_score
         current_status_msg_for_callback = "探索中..."
@@ -111,7 +272,7 @@ def solve_simulated_annealing(ciphertext,
             if current_score > run_best_score: 
                 run_best_score = current_score
                 run_best_key_str = "".join(current_key_list_mutable)
-                run_best_decrypted_text = current_decrypted_text
+                run_best_decrypted_text = current_decrypted_text.render() # 仅在出现更优解时生成字符串
                 current_status_msg_for_callback = "发现本轮更优!" 
                 if status_callback: 
                     status_callback(run_best_key_str, run_best_decrypted_text, run_best_score, i + 1, False, current_status_msg_for_callback)
@@ -0,0 +1,200 @@
+# benchmark.py
+# 破译效果基准：用常用词表合成明文并以随机密钥加密，统计自动破译的密钥恢复率与耗时，
+# 用于比较不同的N-gram表精度、初始密钥策略、分阶段求解、模型与求解参数
+
+import os
+import sys
+import time
+import random
+import string
+import math
+import argparse
+import tempfile
+
+import fitness
+import ngram_tables
+from cipher_logic import encrypt
+from auto_solver import solve_simulated_annealing, INITIAL_KEY_STRATEGIES, WARM_START_MIN_TEMPERATURE_RATIO
+from annealing_profiles import select_profile
+from compiled_text import compile_text
+from language_models import LanguageModel
+
+DEFAULT_TRIALS = 10
+DEFAULT_TEXT_LETTERS = 400
+DEFAULT_RERUNS = 3
+
+def load_ranked_words(filepath=ngram_tables.COMMON_WORDS_FILE_PATH):
+    """读取按常用程度排序的词表 (每行一个单词)，返回小写单词列表。"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return [line.strip().lower() for line in f if line.strip().isalpha()]
+
+def generate_plaintext(rng, words, weights, num_letters):
+    """按词频排名加权 (近似齐普夫分布) 抽取单词组成带句读的明文，直到字母数达到 num_letters。"""
+    sentences = []; sentence = []; letters = 0
+    while letters < num_letters:
+        word = rng.choices(words, weights)[0]
+        sentence.append(word); letters += len(word)
+        if len(sentence) >= rng.randint(6, 14):
+            sentences.append(" ".join(sentence).capitalize() + "."); sentence = []
+    if sentence: sentences.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(sentences)
+
+def make_workload(num_trials=DEFAULT_TRIALS, num_letters=DEFAULT_TEXT_LETTERS, seed=0, words=None):
+    """生成可复现的测试集 [(明文, 密钥, 密文), ...]。"""
+    rng = random.Random(seed)
+    words = words or load_ranked_words()
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    workload = []
+    for _ in range(num_trials):
+        plaintext = generate_plaintext(rng, words, weights, num_letters)
+        key_letters = list(string.ascii_lowercase); rng.shuffle(key_letters)
+        key = "".join(key_letters)
+        workload.append((plaintext, key, encrypt(plaintext, key)))
+    return workload
+
+def letter_recovery_rate(plaintext, decrypted_text):
+    """按字母位置统计解密正确的比例 (不区分大小写)。"""
+    expected = [char.lower() for char in plaintext if char.isalpha()]
+    actual = [char.lower() for char in decrypted_text if char.isalpha()]
+    if not expected: return 1.0
+    return sum(1 for a, b in zip(expected, actual) if a == b) / len(expected)
+
+def run_trials(workload, model=None, num_reruns=DEFAULT_RERUNS, seed=0, solver_kwargs=None, progress_callback=None):
+    """对测试集逐条破译 (每条取 num_reruns 轮中得分最高的结果)，返回每条的结果字典列表。
+    iterations_to_best 为各轮找到本轮最优解时的迭代次数的平均值。
+    每条密文的随机种子固定，不同配置之间的比较因此使用相同的随机序列。"""
+    results = []
+    for trial_index, (plaintext, key, ciphertext) in enumerate(workload):
+        random.seed(seed * 100003 + trial_index)
+        compiled_ciphertext = compile_text(ciphertext)
+        best_text, best_score = "", -float('inf')
+        iterations_to_best = []
+        start_time = time.perf_counter()
+        for _ in range(num_reruns):
+            run_progress = {"score": -float('inf'), "iteration": 0}
+            def track_best(run_key, run_text, score, iteration, is_final, message, run_progress=run_progress):
+                if score > run_progress["score"]: run_progress.update(score=score, iteration=iteration)
+            _, run_text, run_score = solve_simulated_annealing(compiled_ciphertext, model=model, status_callback=track_best, **(solver_kwargs or {}))
+            iterations_to_best.append(run_progress["iteration"])
+            if run_score > best_score: best_text, best_score = run_text, run_score
+        elapsed = time.perf_counter() - start_time
+        recovery = letter_recovery_rate(plaintext, best_text)
+        results.append({"recovery": recovery, "solved": recovery == 1.0, "seconds": elapsed, "score": best_score,
+                        "iterations_to_best": sum(iterations_to_best) / len(iterations_to_best)})
+        if progress_callback: progress_callback(trial_index + 1, len(workload))
+    return results
+
+def summarize_trials(results):
+    """汇总：平均字母恢复率、完全破译比例、平均耗时、平均最优解迭代次数。"""
+    count = len(results) or 1
+    return {"trials": len(results),
+            "mean_recovery": sum(r["recovery"] for r in results) / count,
+            "solved_rate": sum(1 for r in results if r["solved"]) / count,
+            "mean_seconds": sum(r["seconds"] for r in results) / count,
+            "mean_iterations_to_best": sum(r["iterations_to_best"] for r in results) / count}
+
+def compare_table_precisions(precisions=ngram_tables.TABLE_PRECISIONS, workload=None, num_reruns=DEFAULT_RERUNS, seed=0,
+                             solver_kwargs=None, progress_callback=None):
+    """把默认英文表分别保存为各精度的二进制表，在同一测试集上比较密钥恢复率。返回 {精度: 汇总字典 (另含 table_bytes)}。"""
+    workload = workload or make_workload(seed=seed)
+    tables, min_log_probs = ngram_tables.ensure_fitness_tables_loaded()
+    report = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for precision in precisions:
+            tables_path = os.path.join(temp_dir, f"english_{precision}.bin")
+            ngram_tables.save_ngram_tables(tables_path, tables, min_log_probs, precision=precision, scaling=fitness.get_table_scaling())
+            model = LanguageModel(f"english-{precision}", tables_path=tables_path, dictionary_path=ngram_tables.COMMON_WORDS_FILE_PATH)
+            callback = (lambda done, total, precision=precision: progress_callback(precision, done, total)) if progress_callback else None
+            summary = summarize_trials(run_trials(workload, model, num_reruns, seed, solver_kwargs, callback))
+            summary["table_bytes"] = ngram_tables.tables_total_bytes(precision)
+            report[precision] = summary
+            model.unload(); del model
+    return report
+
+def equal_length_warm_schedule(profile):
+    """热启动的初温较低而冷却率不变，默认日程比随机起点短。返回使热启动与随机起点迭代次数相同的
+    {"initial_temperature", "cooling_rate"}：初温与 solve_simulated_annealing 的热启动初温一致，冷却率按同样的迭代次数降到末温。"""
+    min_temperature = profile["min_temperature"]
+    full_iterations = min(profile["max_iterations_per_run"],
+                          math.log(min_temperature / profile["initial_temperature"]) / math.log(profile["cooling_rate"]))
+    warm_temperature = max(profile["initial_temperature"] * profile["warm_start_temperature_scale"],
+                           min_temperature * WARM_START_MIN_TEMPERATURE_RATIO)
+    return {"initial_temperature": warm_temperature, "cooling_rate": (min_temperature / warm_temperature) ** (1 / full_iterations)}
+
+def compare_initial_key_strategies(strategies=INITIAL_KEY_STRATEGIES, workload=None, num_reruns=DEFAULT_RERUNS, seed=0,
+                                   solver_kwargs=None, progress_callback=None, equal_schedule=False):
+    """在同一测试集上比较各初始密钥策略 (随机起点 / 热启动)。返回 {策略: 汇总字典}。
+    equal_schedule 为 True 时额外加入 "warm-equal"：热启动但迭代次数与随机起点相同 (见 equal_length_warm_schedule)，
+    用于区分热启动本身的收益与日程变短带来的差异。档案按第一条密文的长度选取，测试集内各条长度应相近。"""
+    workload = workload or make_workload(seed=seed)
+    ngram_tables.ensure_fitness_tables_loaded()
+    runs = [(strategy, dict(solver_kwargs or {}, initial_key_strategy=strategy)) for strategy in strategies]
+    if equal_schedule and "warm" in strategies:
+        profile = select_profile(len(compile_text(workload[0][2]).codes))
+        runs.append(("warm-equal", dict(solver_kwargs or {}, initial_key_strategy="warm", **equal_length_warm_schedule(profile))))
+    report = {}
+    for label, kwargs in runs:
+        callback = (lambda done, total, label=label: progress_callback(label, done, total)) if progress_callback else None
+        report[label] = summarize_trials(run_trials(workload, None, num_reruns, seed, kwargs, callback))
+    return report
+
+def compare_staged_solving(lengths=(8000, 30000, 100000), num_trials=3, num_reruns=1, seed=0, solver_kwargs=None, progress_callback=None):
+    """在不同长度的密文上比较分阶段求解与整段退火的恢复率与耗时。返回 {(字母数, 是否分阶段): 汇总字典}。
+    整段退火的单次迭代开销与长度成正比，长文本上可能非常慢，可只比较较短的长度。"""
+    ngram_tables.ensure_fitness_tables_loaded()
+    report = {}
+    for num_letters in lengths:
+        workload = make_workload(num_trials, num_letters, seed=seed)
+        for staged in (True, False):
+            label = f"{num_letters}/{'staged' if staged else 'full'}"
+            callback = (lambda done, total, label=label: progress_callback(label, done, total)) if progress_callback else None
+            report[(num_letters, staged)] = summarize_trials(run_trials(workload, None, num_reruns, seed, dict(solver_kwargs or {}, staged=staged), callback))
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="自动破译效果基准 (合成明文 + 随机密钥)")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS, help="测试密文条数")
+    parser.add_argument("--letters", type=int, default=DEFAULT_TEXT_LETTERS, help="每条明文的字母数")
+    parser.add_argument("--reruns", type=int, default=DEFAULT_RERUNS, help="每条密文的退火轮次 (取最优)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--precisions", nargs="+", choices=ngram_tables.TABLE_PRECISIONS, default=list(ngram_tables.TABLE_PRECISIONS),
+                        help="参与比较的表精度")
+    parser.add_argument("--compare", choices=("precision", "initial-key", "staged"), default="precision",
+                        help="比较对象：N-gram表精度 (precision)、初始密钥策略 (initial-key) 或分阶段求解 (staged)")
+    parser.add_argument("--strategies", nargs="+", choices=INITIAL_KEY_STRATEGIES, default=list(INITIAL_KEY_STRATEGIES),
+                        help="参与比较的初始密钥策略")
+    parser.add_argument("--equal-schedule", action="store_true", help="比较初始密钥策略时额外运行与随机起点迭代次数相同的热启动 (warm-equal)")
+    parser.add_argument("--lengths", nargs="+", type=int, default=[8000, 30000, 100000], help="分阶段求解比较所用的密文字母数")
+    args = parser.parse_args(argv)
+
+    workload = make_workload(args.trials, args.letters, args.seed)
+    def report_progress(label, done, total):
+        print(f"\r[{label}] {done}/{total}", end="", file=sys.stderr)
+    if args.compare == "staged":
+        report = compare_staged_solving(args.lengths, args.trials, args.reruns, args.seed, progress_callback=report_progress)
+        print(file=sys.stderr)
+        print(f"{'字母数':>8} {'方式':<8} {'字母恢复率':>10} {'完全破译':>8} {'平均耗时(s)':>11}")
+        for (num_letters, staged), summary in report.items():
+            print(f"{num_letters:>8} {'分阶段' if staged else '整段':<8} {summary['mean_recovery'] * 100:>9.2f}% "
+                  f"{summary['solved_rate'] * 100:>7.1f}% {summary['mean_seconds']:>11.2f}")
+        return
+    if args.compare == "initial-key":
+        report = compare_initial_key_strategies(args.strategies, workload, args.reruns, args.seed, progress_callback=report_progress,
+                                                equal_schedule=args.equal_schedule)
+        print(file=sys.stderr)
+        print(f"{'策略':<10} {'字母恢复率':>10} {'完全破译':>8} {'平均耗时(s)':>11} {'最优解迭代次数':>14}")
+        for strategy, summary in report.items():
+            print(f"{strategy:<10} {summary['mean_recovery'] * 100:>9.2f}% {summary['solved_rate'] * 100:>7.1f}% "
+                  f"{summary['mean_seconds']:>11.2f} {summary['mean_iterations_to_best']:>14.0f}")
+        return
+    report = compare_table_precisions(args.precisions, workload, args.reruns, args.seed, progress_callback=report_progress)
+    print(file=sys.stderr)
+    baseline = report.get("float64")
+    print(f"{'精度':<8} {'表大小(MB)':>10} {'字母恢复率':>10} {'完全破译':>8} {'平均耗时(s)':>11} {'恢复率变化':>10}")
+    for precision, summary in report.items():
+        delta = f"{(summary['mean_recovery'] - baseline['mean_recovery']) * 100:+.2f}%" if baseline else "-"
+        print(f"{precision:<8} {summary['table_bytes'] / 1024 / 1024:>10.2f} {summary['mean_recovery'] * 100:>9.2f}% "
+              f"{summary['solved_rate'] * 100:>7.1f}% {summary['mean_seconds']:>11.2f} {delta:>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# build_ngram_model.py
+# 语料N-gram模型构建工具：分块流式读取语料，用进程池统计1至4阶N-gram，合并后输出文本计数文件与二进制稠密表
+
+import os
+import re
+import sys
+import math
+import time
+import string
+import argparse
+import collections
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from ngram_tables import TABLE_ORDERS, TABLE_LENGTHS, TABLE_PRECISIONS, save_ngram_tables
+
+NGRAM_FILE_NAMES = {1: "monograms", 2: "bigrams", 3: "trigrams", 4: "quadgrams"}
+DEFAULT_CHUNK_CHARS = 4 * 1024 * 1024 # 每个分块的字符数；工作进程的峰值内存约为分块大小的十余倍 (4M字符约 60 MB)
+MAX_CARRY_LETTERS = max(TABLE_ORDERS) - 1 # 跨分块边界的N-gram最多需要前一块末尾的字母数
+_NON_LETTER_RE = re.compile(r'[^A-Z]+')
+_LETTER_CODE_TABLE = bytes.maketrans(string.ascii_uppercase.encode('ascii'), bytes(range(26))) # A-Z -> 0..25
+_UINT32_FORMAT = next(code for code in "IL" if array(code).itemsize == 4)
+
+def _ngram_index(ngram_str):
+    index = 0
+    for char in ngram_str: index = index * 26 + ord(char) - 65
+    return index
+
+def _new_count_arrays():
+    return {n: array('Q', bytes(8 * TABLE_LENGTHS[n])) for n in TABLE_ORDERS}
+
+def _count_quadgrams(codes):
+    """统计字母编码串 (每字节 0..25) 中所有重叠的四元组，返回 {四元组下标: 次数}。
+    四个字节恰为一个 32 位整数：按起点对 4 取余分成四组，每组把字节串直接视为整数数组计数，全程不生成中间列表。"""
+    packed_counts = collections.Counter()
+    view = memoryview(codes)
+    for offset in range(4):
+        usable = (len(codes) - offset) // 4 * 4
+        if usable > 0: packed_counts.update(view[offset:offset + usable].cast(_UINT32_FORMAT))
+    quad_counts = {}
+    for packed, count in packed_counts.items():
+        a, b, c, d = packed.to_bytes(4, sys.byteorder)
+        quad_counts[((a * 26 + b) * 26 + c) * 26 + d] = count
+    return quad_counts
+
+def count_chunk(text):
+    """工作进程：统计一个文本分块内的各阶N-gram (仅A-Z，忽略其他字符)。
+    返回 (开头字母, 结尾字母, {n: (下标数组, 计数数组)})；只传回出现过的项，首尾字母供父进程补计跨分块的N-gram。
+    只直接统计四元组；n 阶计数由 n+1 阶按前缀求和，再补上以分块末尾为终点、不是任何 n+1 元组前缀的那一个窗口。"""
+    letters = _NON_LETTER_RE.sub('', text.upper())
+    codes = letters.encode('ascii').translate(_LETTER_CODE_TABLE)
+    counts = {max(TABLE_ORDERS): _count_quadgrams(codes)}
+    for n in sorted(TABLE_ORDERS, reverse=True)[1:]:
+        lower_counts = collections.defaultdict(int)
+        for index, count in counts[n + 1].items(): lower_counts[index // 26] += count
+        if len(letters) >= n: lower_counts[_ngram_index(letters[-n:])] += 1
+        counts[n] = lower_counts
+    sparse_counts = {n: (array('L', counts[n].keys()), array('Q', counts[n].values())) for n in TABLE_ORDERS}
+    return letters[:MAX_CARRY_LETTERS], letters[-MAX_CARRY_LETTERS:], sparse_counts
+
+def _count_junction(count_arrays, carry, head):
+    """补计跨越分块边界的N-gram：起点落在 carry 内、终点越过边界的窗口，每个N-gram恰好计数一次。"""
+    joined = carry + head
+    for n in TABLE_ORDERS:
+        for start in range(max(0, len(carry) - n + 1), len(carry)):
+            if start + n <= len(joined): count_arrays[n][_ngram_index(joined[start:start + n])] += 1
+
+def iter_corpus_chunks(paths, chunk_chars=DEFAULT_CHUNK_CHARS, encoding='utf-8'):
+    """按固定字符数流式读取语料文件 (目录则递归读取其中的 .txt 文件)，逐块产出文本。"""
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names if name.lower().endswith(".txt"))
+        else: file_paths = [path]
+        for file_path in file_paths:
+            with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
+                while True:
+                    chunk = f.read(chunk_chars)
+                    if not chunk: break
+                    yield chunk
+
+def build_ngram_counts(paths, num_workers=None, chunk_chars=DEFAULT_CHUNK_CHARS, encoding='utf-8', progress_callback=None):
+    """并行统计语料的1至4阶N-gram，返回 {n: 稠密计数数组}。
+    分块按顺序合并，在途分块数有上限，因此内存占用与语料大小无关。"""
+    num_workers = num_workers or os.cpu_count() or 1
+    max_in_flight = num_workers * 2
+    merged = _new_count_arrays()
+    carry = ""; chunks_done = 0; letters_done = 0
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = collections.deque()
+        chunk_iter = iter_corpus_chunks(paths, chunk_chars, encoding)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_in_flight:
+                try: pending.append(executor.submit(count_chunk, next(chunk_iter)))
+                except StopIteration: exhausted = True
+            if not pending: break
+            head, tail, sparse_counts = pending.popleft().result()
+            _count_junction(merged, carry, head)
+            carry = tail if len(tail) >= MAX_CARRY_LETTERS else (carry + tail)[-MAX_CARRY_LETTERS:]
+            for n in TABLE_ORDERS:
+                merged_counts = merged[n]
+                for index, count in zip(*sparse_counts[n]): merged_counts[index] += count
+            chunks_done += 1; letters_done += sum(sparse_counts[1][1])
+            if progress_callback: progress_callback(chunks_done, letters_done)
+    return merged
+
+def prune_counts(count_arrays, min_count=1, max_ngrams=None):
+    """裁剪计数：丢弃低于 min_count 的项，并可只保留每阶出现最多的 max_ngrams 项。返回 {n: {N-gram: 计数}}。"""
+    pruned = {}
+    for n in TABLE_ORDERS:
+        entries = [(index, count) for index, count in enumerate(count_arrays[n]) if count >= max(min_count, 1)]
+        entries.sort(key=lambda item: item[1], reverse=True)
+        if max_ngrams is not None: entries = entries[:max_ngrams]
+        pruned[n] = {_index_to_ngram(index, n): count for index, count in entries}
+    return pruned
+
+def _index_to_ngram(index, n):
+    chars = []
+    for _ in range(n):
+        index, code = divmod(index, 26); chars.append(chr(65 + code))
+    return ''.join(reversed(chars))
+
+def log_prob_tables_from_counts(counts_by_order):
+    """按 fitness 读取计数文件时相同的规则计算稠密对数概率表，返回 (稠密表字典, 最小对数概率字典)。"""
+    tables = {}; min_log_probs = {}
+    for n in TABLE_ORDERS:
+        total = sum(counts_by_order[n].values())
+        if total == 0: # 与 fitness 的备用值一致
+            min_log_probs[n] = math.log(1e-9) - math.log(10)
+            tables[n] = array('d', [min_log_probs[n]]) * TABLE_LENGTHS[n]; continue
+        min_log_probs[n] = math.log(0.1 / total)
+        table = array('d', [min_log_probs[n]]) * TABLE_LENGTHS[n]
+        for ngram_str, count in counts_by_order[n].items(): table[_ngram_index(ngram_str)] = math.log(count / total)
+        tables[n] = table
+    return tables, min_log_probs
+
+def write_ngram_text_files(counts_by_order, output_dir, prefix):
+    """以现有数据文件的格式 (每行 'NGRAM COUNT'，按计数降序) 写出各阶计数文件，返回文件路径列表。"""
+    written_paths = []
+    for n in TABLE_ORDERS:
+        path = os.path.join(output_dir, f"{prefix}_{NGRAM_FILE_NAMES[n]}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            for ngram_str, count in counts_by_order[n].items(): f.write(f"{ngram_str} {count}\n")
+        written_paths.append(path)
+    return written_paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从自有语料构建N-gram语言模型 (1至4阶)")
+    parser.add_argument("inputs", nargs="+", help="语料文件或目录 (目录下的 .txt 文件会被递归读取)")
+    parser.add_argument("-o", "--output-dir", default=".", help="输出目录")
+    parser.add_argument("--prefix", default="custom", help="输出文件名前缀，如 custom_quadgrams.txt")
+    parser.add_argument("--workers", type=int, default=None, help="统计进程数 (默认为CPU核数)")
+    parser.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS, help="每个分块的字符数")
+    parser.add_argument("--encoding", default="utf-8", help="语料文件编码")
+    parser.add_argument("--min-count", type=int, default=1, help="丢弃出现次数低于此值的N-gram")
+    parser.add_argument("--max-ngrams", type=int, default=None, help="每阶最多保留的N-gram数 (按计数取前K项)")
+    parser.add_argument("--no-text", action="store_true", help="不输出文本计数文件")
+    parser.add_argument("--no-binary", action="store_true", help="不输出二进制稠密表")
+    parser.add_argument("--precision", choices=TABLE_PRECISIONS, default="float64", help="二进制表的存储精度 (float32/int16 为紧凑格式)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    start_time = time.time()
+    def report(chunks_done, letters_done):
+        print(f"\r已处理 {chunks_done} 个分块，{letters_done} 个字母 ({time.time() - start_time:.1f}s)", end="", file=sys.stderr)
+    count_arrays = build_ngram_counts(args.inputs, args.workers, args.chunk_chars, args.encoding, progress_callback=report)
+    print(file=sys.stderr)
+    counts_by_order = prune_counts(count_arrays, args.min_count, args.max_ngrams)
+    for n in TABLE_ORDERS: print(f"{NGRAM_FILE_NAMES[n]}: 保留 {len(counts_by_order[n])} 项，总计数 {sum(counts_by_order[n].values())}")
+    if not args.no_text:
+        for path in write_ngram_text_files(counts_by_order, args.output_dir, args.prefix): print(f"已写出 {path}")
+    if not args.no_binary:
+        binary_path = os.path.join(args.output_dir, f"{args.prefix}_ngrams.bin")
+        tables, min_log_probs = log_prob_tables_from_counts(counts_by_order)
+        save_ngram_tables(binary_path, tables, min_log_probs, precision=args.precision)
+        print(f"已写出 {binary_path} ({args.precision}，{os.path.getsize(binary_path) / 1024 / 1024:.1f} MB)")
+
+if __name__ == '__main__':
+    main()
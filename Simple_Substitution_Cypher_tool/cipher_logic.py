@@ -2,6 +2,7 @@
 # 单表代换密码的加密与解密核心逻辑
 
 import string
+from compiled_text import CompiledText, OTHER_LETTER_CODE
 
 PLAINTEXT_ALPHABET = string.ascii_lowercase  # 标准26个小写英文字母
 
@@ -28,8 +29,21 @@ def encrypt(plaintext, key):
             ciphertext += char
     return ciphertext
 
+def decryption_code_map(key):
+    """由密钥生成解密用的编码映射表 (长度27)：下标为密文字母编码，值为明文字母编码。"""
+    if not validate_key(key):
+        raise ValueError("无效密钥。密钥必须是26个不同的小写字母的排列。")
+    code_map = [OTHER_LETTER_CODE] * 27
+    for plain_code, cipher_char in enumerate(key.lower()): code_map[ord(cipher_char) - 97] = plain_code
+    return code_map
+
+def decrypt_compiled(compiled_ciphertext, key):
+    """解密预编译的密文，返回预编译形式的明文 (不生成字符串，供适应度评分直接使用)。"""
+    return compiled_ciphertext.substitute(decryption_code_map(key))
+
 def decrypt(ciphertext, key):
-    """使用单表代换解密密文。"""
+    """使用单表代换解密密文。ciphertext 可以是字符串或 CompiledText。"""
+    if isinstance(ciphertext, CompiledText): return decrypt_compiled(ciphertext, key).render()
     if not validate_key(key):
         raise ValueError("无效密钥。密钥必须是26个不同的小写字母的排列。")
     inv_key_map = {cipher_char: plain_char for plain_char, cipher_char in zip(PLAINTEXT_ALPHABET, key.lower())}
@@ -0,0 +1,96 @@
+# compiled_text.py
+# 文本的预编译表示：一次完成大小写归一化、字母提取与单词切分，供解密、适应度评分、部分密钥应用和界面渲染复用
+
+import string
+
+OTHER_LETTER_CODE = 26 # 非ASCII字母 (包括 ı、ſ、ß) 的编码：不参与代换，任何N-gram都查不到，也不属于任何单词
+_UPPER_LETTERS = string.ascii_uppercase
+_LOWER_LETTERS = string.ascii_lowercase
+_UPPER_CODES = {char: code for code, char in enumerate(_UPPER_LETTERS)}
+_LETTER_CODES = dict(_UPPER_CODES, **{char: code for code, char in enumerate(_LOWER_LETTERS)}) # 按原字符判断，ı、ſ 等大写后才像ASCII的字母不算在内
+
+def _upper_other_letter(char):
+    """非ASCII字母的大写形式；大写后变成ASCII字母或多个字符的 (如 ı、ſ、ß) 保持原样。"""
+    upper_char = char.upper()
+    return upper_char if len(upper_char) == 1 and not upper_char.isascii() else char
+
+def letter_codes(text):
+    """把文本中的字母 (str.isalpha) 转换为编码列表 (A=0 ... Z=25)，非ASCII字母记为26。"""
+    if text.isascii(): return [byte - 65 for byte in ''.join(filter(str.isalpha, text.upper())).encode('ascii')]
+    return [_LETTER_CODES.get(char, OTHER_LETTER_CODE) for char in text if char.isalpha()]
+
+class CompiledText:
+    """文本的预编译形式。
+    属性:
+        template (str): 原始文本，非字母字符与非ASCII字母按原样取自这里。
+        codes (list[int]): 字母序列的整数编码 (A=0 ... Z=25，其他字母为26)。
+        letter_positions (list[int]): 每个字母在 template 中的下标。
+        upper_mask (list[bool]): 每个字母在原文中是否为大写。
+        word_spans (list[tuple]): 由连续ASCII字母组成的单词在字母序列中的 [起, 止) 区间。
+    经 substitute() 代换得到的新对象与原对象共享上述版式信息，只替换 codes。
+    """
+    __slots__ = ("template", "codes", "letter_positions", "upper_mask", "word_spans", "_positions_by_letter")
+
+    def __init__(self, text):
+        codes = []; letter_positions = []; upper_mask = []; word_spans = []
+        span_start = None; previous_ascii_position = -2; previous_ascii_index = -1
+        for position, char in enumerate(text):
+            if not char.isalpha(): continue
+            code = _LETTER_CODES.get(char, OTHER_LETTER_CODE)
+            if code != OTHER_LETTER_CODE:
+                if position != previous_ascii_position + 1: # 与前一个ASCII字母不相邻：结束旧单词，开始新单词
+                    if span_start is not None: word_spans.append((span_start, previous_ascii_index + 1))
+                    span_start = len(codes)
+                previous_ascii_position = position; previous_ascii_index = len(codes)
+            codes.append(code); letter_positions.append(position); upper_mask.append(char.isupper())
+        if span_start is not None: word_spans.append((span_start, previous_ascii_index + 1))
+        self.template = text
+        self.codes = codes
+        self.letter_positions = letter_positions
+        self.upper_mask = upper_mask
+        self.word_spans = word_spans
+        self._positions_by_letter = None
+
+    def substitute(self, code_map):
+        """按编码映射表 (长度27，code_map[密文编码] = 明文编码) 代换全部字母，返回共享版式的新对象。"""
+        substituted = object.__new__(CompiledText)
+        substituted.template = self.template
+        substituted.codes = list(map(code_map.__getitem__, self.codes))
+        substituted.letter_positions = self.letter_positions
+        substituted.upper_mask = self.upper_mask
+        substituted.word_spans = self.word_spans
+        substituted._positions_by_letter = None
+        return substituted
+
+    @property
+    def positions_by_letter(self):
+        """26个列表，第i个为字母编码i在 template 中出现的全部下标 (首次访问时建立)。"""
+        if self._positions_by_letter is None:
+            positions = [[] for _ in range(26)]
+            for position, code in zip(self.letter_positions, self.codes):
+                if code != OTHER_LETTER_CODE: positions[code].append(position)
+            self._positions_by_letter = positions
+        return self._positions_by_letter
+
+    @property
+    def letters(self):
+        """大写的纯字母字符串 (每个字母对应一个字符)，ASCII文本上等价于 ''.join(filter(str.isalpha, text.upper()))。"""
+        if OTHER_LETTER_CODE not in self.codes: return ''.join(map(_UPPER_LETTERS.__getitem__, self.codes))
+        return ''.join(_UPPER_LETTERS[code] if code != OTHER_LETTER_CODE else _upper_other_letter(self.template[position])
+                       for code, position in zip(self.codes, self.letter_positions))
+
+    def words(self):
+        """返回全部单词 (大写)，等价于 re.findall(r'[a-zA-Z]+', text.upper())。"""
+        letters = self.letters
+        return [letters[start:end] for start, end in self.word_spans]
+
+    def render(self):
+        """按原文的大小写与标点还原为字符串。"""
+        output = list(self.template)
+        for position, code, is_upper in zip(self.letter_positions, self.codes, self.upper_mask):
+            if code != OTHER_LETTER_CODE: output[position] = _UPPER_LETTERS[code] if is_upper else _LOWER_LETTERS[code]
+        return ''.join(output)
+
+def compile_text(text):
+    """返回文本的预编译形式；已是 CompiledText 时原样返回。"""
+    return text if isinstance(text, CompiledText) else CompiledText(text)
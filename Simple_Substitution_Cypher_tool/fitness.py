@@ -4,6 +4,8 @@
 import math
 import re
 import os
+from array import array
+from compiled_text import CompiledText, OTHER_LETTER_CODE, compile_text, letter_codes
 
 # --- 全局变量定义 (与上一版相同) ---
 MONOGRAM_SCORES = {}
@@ -18,6 +20,12 @@ TRIGRAMS_LOADED = False
 QUADGRAMS_LOADED = False
 FITNESS_DICTIONARY_LOADED = False
 
+# 稠密 N-gram 表 {n: 长度为 26**n 的对数概率数组}，下标为字母编码 (A=0) 的26进制值。
+# 可以是本进程编译的 array('d')，也可以是附加到共享内存/内存映射文件上的只读 memoryview。
+NGRAM_TABLES = {}
+# 紧凑 (量化) 表的反量化参数 {n: (缩放系数, 偏移量)}，对数概率 = 偏移量 + 缩放系数 * 表中的值；完整精度的阶数不在其中。
+NGRAM_TABLE_SCALING = {}
+
 MIN_MONOGRAM_LOG_PROB = -12.0
 MIN_BIGRAM_LOG_PROB = -18.0
 MIN_TRIGRAM_LOG_PROB = -22.0
@@ -26,12 +34,12 @@ MIN_QUADGRAM_LOG_PROB = -25.0
 DEFAULT_FITNESS_WORDS = {"THE", "AND", "ING", "HER", "WAS", "FOR", "THAT", "THIS"}
 
 # --- _load_ngrams_from_file, load_monograms, load_bigrams, etc. (与上一版相同) ---
-def _load_ngrams_from_file(filepath, n, scores_dict_ref, loaded_flag_setter, min_log_prob_setter, ngram_type_name):
-    """通用N-gram加载函数，从文件读取N-gram及其计数，计算对数概率并存储。"""
-    if globals()[f"{ngram_type_name.upper()}S_LOADED"]:
-        return
+def read_ngram_log_probs(filepath, n, ngram_type_name):
+    """从计数文件读取N-gram并计算对数概率，返回 (对数概率字典, 最小对数概率)。
+    文件缺失或无效时返回只含 "DEFAULT_FALLBACK" 的字典和极低备用值。"""
     raw_counts = {}; total_ngram_count = 0
     very_low_log_prob_fallback = math.log(1e-9) 
+    fallback = ({"DEFAULT_FALLBACK": very_low_log_prob_fallback}, very_low_log_prob_fallback - math.log(10))
     try:
         if not os.path.exists(filepath) or os.path.getsize(filepath) == 0: raise FileNotFoundError 
         with open(filepath, 'r', encoding='utf-8') as f:
@@ -49,25 +57,73 @@ def _load_ngrams_from_file(filepath, n, scores_dict_ref, loaded_flag_setter, min
                     except ValueError: pass 
         if not raw_counts or total_ngram_count == 0:
             print(f"适应度警告：未能从 '{filepath}' 加载有效的 {ngram_type_name} 计数。将使用极低备用值。")
-            scores_dict_ref.clear(); scores_dict_ref["DEFAULT_FALLBACK"] = very_low_log_prob_fallback 
-            min_log_prob_setter(very_low_log_prob_fallback - math.log(10))
-        else:
-            scores_dict_ref.clear()
-            for ngram_str, count in raw_counts.items():
-                scores_dict_ref[ngram_str] = math.log(count / total_ngram_count)
-            min_prob_val = math.log(0.1 / total_ngram_count)
-            min_log_prob_setter(min_prob_val)
-            print(f"适应度函数：成功加载并处理 {len(scores_dict_ref)} 个 {ngram_type_name}。总计数: {total_ngram_count}。最小对数概率: {min_prob_val:.4f}")
+            return fallback
+        scores = {ngram_str: math.log(count / total_ngram_count) for ngram_str, count in raw_counts.items()}
+        min_prob_val = math.log(0.1 / total_ngram_count)
+        print(f"适应度函数：成功加载并处理 {len(scores)} 个 {ngram_type_name}。总计数: {total_ngram_count}。最小对数概率: {min_prob_val:.4f}")
+        return scores, min_prob_val
     except FileNotFoundError:
         print(f"适应度错误：{ngram_type_name.capitalize()} 文件 '{filepath}' 未找到或为空。{ngram_type_name.capitalize()} 适应度将受严重影响，使用极低备用值。")
-        scores_dict_ref.clear(); scores_dict_ref["DEFAULT_FALLBACK"] = very_low_log_prob_fallback
-        min_log_prob_setter(very_low_log_prob_fallback - math.log(10))
+        return fallback
     except Exception as e:
         print(f"适应度错误：加载 {ngram_type_name} 时发生意外错误：{e}。使用极低备用值。")
-        scores_dict_ref.clear(); scores_dict_ref["DEFAULT_FALLBACK"] = very_low_log_prob_fallback
-        min_log_prob_setter(very_low_log_prob_fallback - math.log(10))
+        return fallback
+
+def read_ngram_table(filepath, n, ngram_type_name):
+    """从计数文件直接编译稠密表，返回 (稠密表, 最小对数概率)；不修改本模块的全局表 (供语言模型注册表使用)。"""
+    scores, min_prob_val = read_ngram_log_probs(filepath, n, ngram_type_name)
+    return _build_dense_ngram_table(n, scores, min_prob_val), min_prob_val
+
+def _load_ngrams_from_file(filepath, n, scores_dict_ref, loaded_flag_setter, min_log_prob_setter, ngram_type_name):
+    """通用N-gram加载函数，从文件读取N-gram及其计数，计算对数概率并存储到全局表。"""
+    if globals()[f"{ngram_type_name.upper()}S_LOADED"]:
+        return
+    scores, min_prob_val = read_ngram_log_probs(filepath, n, ngram_type_name)
+    scores_dict_ref.clear(); scores_dict_ref.update(scores)
+    min_log_prob_setter(min_prob_val)
+    NGRAM_TABLES[n] = _build_dense_ngram_table(n, scores_dict_ref, min_prob_val)
+    NGRAM_TABLE_SCALING.pop(n, None)
     loaded_flag_setter()
 
+def _ngram_to_index(ngram_str):
+    """把仅含A-Z的N-gram字符串转换为稠密表下标，含其他字符时返回None。"""
+    index = 0
+    for char in ngram_str:
+        code = ord(char) - 65
+        if not 0 <= code < 26: return None
+        index = index * 26 + code
+    return index
+
+def _build_dense_ngram_table(n, scores_dict, min_log_prob_val):
+    """将N-gram对数概率字典编译为稠密数组，未出现的N-gram取最小对数概率。"""
+    table = array('d', [min_log_prob_val]) * (26 ** n)
+    for ngram_str, log_prob in scores_dict.items():
+        index = _ngram_to_index(ngram_str)
+        if index is not None: table[index] = log_prob
+    return table
+
+def install_ngram_tables(tables, min_log_probs, scaling=None):
+    """安装外部提供的稠密N-gram表 (如共享内存视图)，并将对应阶数标记为已加载，从而跳过文件加载。
+    scaling 为紧凑表的反量化参数 {n: (缩放系数, 偏移量)}。"""
+    global MIN_MONOGRAM_LOG_PROB, MIN_BIGRAM_LOG_PROB, MIN_TRIGRAM_LOG_PROB, MIN_QUADGRAM_LOG_PROB
+    global MONOGRAMS_LOADED, BIGRAMS_LOADED, TRIGRAMS_LOADED, QUADGRAMS_LOADED
+    for n, table in tables.items():
+        NGRAM_TABLES[n] = table
+        if scaling and n in scaling: NGRAM_TABLE_SCALING[n] = scaling[n]
+        else: NGRAM_TABLE_SCALING.pop(n, None)
+    if 1 in tables: MIN_MONOGRAM_LOG_PROB = min_log_probs[1]; MONOGRAMS_LOADED = True
+    if 2 in tables: MIN_BIGRAM_LOG_PROB = min_log_probs[2]; BIGRAMS_LOADED = True
+    if 3 in tables: MIN_TRIGRAM_LOG_PROB = min_log_probs[3]; TRIGRAMS_LOADED = True
+    if 4 in tables: MIN_QUADGRAM_LOG_PROB = min_log_probs[4]; QUADGRAMS_LOADED = True
+
+def get_min_log_probs():
+    """返回各阶N-gram当前使用的最小对数概率 {n: 值}。"""
+    return {1: MIN_MONOGRAM_LOG_PROB, 2: MIN_BIGRAM_LOG_PROB, 3: MIN_TRIGRAM_LOG_PROB, 4: MIN_QUADGRAM_LOG_PROB}
+
+def get_table_scaling():
+    """返回当前全局表的反量化参数 {n: (缩放系数, 偏移量)} 的副本。"""
+    return dict(NGRAM_TABLE_SCALING)
+
 def load_monograms(filepath="english_monograms.txt"):
     def set_loaded_flag(): global MONOGRAMS_LOADED; MONOGRAMS_LOADED = True
     def set_min_log_prob_value(val): global MIN_MONOGRAM_LOG_PROB; MIN_MONOGRAM_LOG_PROB = val
@@ -88,28 +144,79 @@ def load_quadgrams(filepath="english_quadgrams.txt"):
     def set_min_log_prob_value(val): global MIN_QUADGRAM_LOG_PROB; MIN_QUADGRAM_LOG_PROB = val
     _load_ngrams_from_file(filepath, 4, QUADGRAM_SCORES, set_loaded_flag, set_min_log_prob_value, "quadgram")
 
-def load_dictionary_for_fitness(filepath="common_words.txt"): # (与上一版相同)
-    global ENGLISH_DICTIONARY_FITNESS, FITNESS_DICTIONARY_LOADED
-    if FITNESS_DICTIONARY_LOADED: return
+def read_dictionary_words(filepath):
+    """读取词典文件，返回大写单词集合；文件缺失或为空时返回内置的默认词典。"""
     try:
         if not os.path.exists(filepath) or os.path.getsize(filepath) == 0: raise FileNotFoundError
         with open(filepath, 'r', encoding='utf-8') as f:
-            ENGLISH_DICTIONARY_FITNESS = set(word.strip().upper() for word in f if word.strip().isalpha())
-        if not ENGLISH_DICTIONARY_FITNESS:
+            words = set(word.strip().upper() for word in f if word.strip().isalpha())
+        if not words:
              print(f"适应度警告：词典文件 '{filepath}' 内容为空或无效。将使用内置的默认词典。")
-             ENGLISH_DICTIONARY_FITNESS = DEFAULT_FITNESS_WORDS
+             words = DEFAULT_FITNESS_WORDS
     except FileNotFoundError:
         print(f"适应度警告：词典文件 '{filepath}' 未找到。将使用内置的默认词典。")
-        ENGLISH_DICTIONARY_FITNESS = DEFAULT_FITNESS_WORDS
+        words = DEFAULT_FITNESS_WORDS
+    return words
+
+def load_dictionary_for_fitness(filepath="common_words.txt"): # (与上一版相同)
+    global ENGLISH_DICTIONARY_FITNESS, FITNESS_DICTIONARY_LOADED
+    if FITNESS_DICTIONARY_LOADED: return
+    ENGLISH_DICTIONARY_FITNESS = read_dictionary_words(filepath)
     FITNESS_DICTIONARY_LOADED = True
 
-def _get_ngram_text_score(text, n, scores_dict, min_log_prob_val, loaded_checker_func): # (与上一版相同)
+def _score_ngram_codes(codes, n, table, min_log_prob_val, scaling=None):
+    """在稠密表上计算字母编码序列的平均N-gram对数概率。scaling 为紧凑表的 (缩放系数, 偏移量)。"""
+    if len(codes) < n: return min_log_prob_val * (n + (n - len(codes)))
+    num_ngrams_in_text = len(codes) - n + 1
+    scale, offset = scaling or (1.0, 0.0)
+    if OTHER_LETTER_CODE in codes: # 罕见情况：含非ASCII字母，逐个窗口判断
+        current_score_sum = 0.0
+        for i in range(num_ngrams_in_text):
+            index = 0
+            for code in codes[i:i+n]:
+                if code == OTHER_LETTER_CODE: index = None; break
+                index = index * 26 + code
+            current_score_sum += min_log_prob_val if index is None else offset + scale * table[index]
+        return current_score_sum / num_ngrams_in_text
+    if n == 1: indices = codes
+    elif n == 2: indices = [a * 26 + b for a, b in zip(codes, codes[1:])]
+    elif n == 3: indices = [(a * 26 + b) * 26 + c for a, b, c in zip(codes, codes[1:], codes[2:])]
+    else: indices = [((a * 26 + b) * 26 + c) * 26 + d for a, b, c, d in zip(codes, codes[1:], codes[2:], codes[3:])]
+    mean_value = sum(map(table.__getitem__, indices)) / num_ngrams_in_text
+    return mean_value if scaling is None else offset + scale * mean_value # 线性量化：先求均值再反量化，与逐项反量化等价
+
+def _score_all_ngram_orders(codes, tables=NGRAM_TABLES, scaling=NGRAM_TABLE_SCALING):
+    """一次遍历同时计算1至4阶的平均对数概率，高阶下标由低阶下标递推得到 (要求各阶稠密表均已就绪)。"""
+    scores = []; indices = codes
+    for n in (1, 2, 3, 4):
+        if n > 1: indices = [index * 26 + code for index, code in zip(indices, codes[n - 1:])]
+        mean_value = sum(map(tables[n].__getitem__, indices)) / len(indices)
+        if n in scaling:
+            scale, offset = scaling[n]; mean_value = offset + scale * mean_value
+        scores.append(mean_value)
+    return scores
+
+def _resolve_model(model):
+    """把模型句柄 (LanguageModel 或已注册的模型名) 解析为模型对象；None 表示使用本模块的全局英文表。"""
+    if model is None or not isinstance(model, str): return model
+    import language_models # 延迟导入：language_models 依赖本模块的读取函数
+    return language_models.get_model(model)
+
+def _get_ngram_text_score(text, n, scores_dict, min_log_prob_val, loaded_checker_func, model=None):
+    model = _resolve_model(model)
+    if model is not None: # 指定语言模型时直接使用其稠密表
+        tables, min_log_probs = model.get_ngram_tables()
+        codes = text.codes if isinstance(text, CompiledText) else letter_codes(text)
+        return _score_ngram_codes(codes, n, tables[n], min_log_probs[n], model.get_table_scaling().get(n))
     if not loaded_checker_func():
         if n == 1 and not MONOGRAMS_LOADED: load_monograms()
         elif n == 2 and not BIGRAMS_LOADED: load_bigrams()
         elif n == 3 and not TRIGRAMS_LOADED: load_trigrams()
         elif n == 4 and not QUADGRAMS_LOADED: load_quadgrams()
-    text_upper = ''.join(filter(str.isalpha, text.upper()))
+    if n in NGRAM_TABLES: # 优先使用稠密表 (本地编译或共享内存附加)
+        codes = text.codes if isinstance(text, CompiledText) else letter_codes(text)
+        return _score_ngram_codes(codes, n, NGRAM_TABLES[n], get_min_log_probs()[n], NGRAM_TABLE_SCALING.get(n))
+    text_upper = text.letters if isinstance(text, CompiledText) else ''.join(filter(str.isalpha, text.upper()))
     if len(text_upper) < n: return min_log_prob_val * (n + (n - len(text_upper))) 
     current_score_sum = 0.0; num_ngrams_in_text = 0
     for i in range(len(text_upper) - n + 1):
@@ -118,28 +225,34 @@ def _get_ngram_text_score(text, n, scores_dict, min_log_prob_val, loaded_checker
         num_ngrams_in_text += 1
     return current_score_sum / num_ngrams_in_text if num_ngrams_in_text > 0 else min_log_prob_val * n
 
-def get_monogram_score(text): return _get_ngram_text_score(text, 1, MONOGRAM_SCORES, MIN_MONOGRAM_LOG_PROB, lambda: MONOGRAMS_LOADED)
-def get_bigram_score(text): return _get_ngram_text_score(text, 2, BIGRAM_SCORES, MIN_BIGRAM_LOG_PROB, lambda: BIGRAMS_LOADED)
-def get_trigram_score(text): return _get_ngram_text_score(text, 3, TRIGRAM_SCORES, MIN_TRIGRAM_LOG_PROB, lambda: TRIGRAMS_LOADED)
-def get_quadgram_score(text): return _get_ngram_text_score(text, 4, QUADGRAM_SCORES, MIN_QUADGRAM_LOG_PROB, lambda: QUADGRAMS_LOADED)
+def get_monogram_score(text, model=None): return _get_ngram_text_score(text, 1, MONOGRAM_SCORES, MIN_MONOGRAM_LOG_PROB, lambda: MONOGRAMS_LOADED, model)
+def get_bigram_score(text, model=None): return _get_ngram_text_score(text, 2, BIGRAM_SCORES, MIN_BIGRAM_LOG_PROB, lambda: BIGRAMS_LOADED, model)
+def get_trigram_score(text, model=None): return _get_ngram_text_score(text, 3, TRIGRAM_SCORES, MIN_TRIGRAM_LOG_PROB, lambda: TRIGRAMS_LOADED, model)
+def get_quadgram_score(text, model=None): return _get_ngram_text_score(text, 4, QUADGRAM_SCORES, MIN_QUADGRAM_LOG_PROB, lambda: QUADGRAMS_LOADED, model)
 
 # --- 更新 get_dictionary_score ---
-def get_dictionary_score(text, weighting_scheme='linear'):
+def get_dictionary_score(text, weighting_scheme='linear', model=None):
     """
     基于在文本中找到的词典词及其长度计算得分。
     参数:
-        text (str): 需要评估的文本。
+        text (str | CompiledText): 需要评估的文本。
         weighting_scheme (str): 权重方案。
             'count': 简单地计算找到的词占总词数的百分比 (旧行为)。
             'linear': 找到的词的得分贡献与其长度成正比。
             'quadratic': 找到的词的得分贡献与其长度的平方成正比。
+        model (LanguageModel | str): 语言模型或其注册名，None 时使用全局英文词典。
     返回:
         float: 规范化后的词典得分 (0-100范围)。
     """
-    if not FITNESS_DICTIONARY_LOADED:
-        load_dictionary_for_fitness()
+    model = _resolve_model(model)
+    if model is not None: dictionary = model.get_dictionary()
+    else:
+        if not FITNESS_DICTIONARY_LOADED:
+            load_dictionary_for_fitness()
+        dictionary = ENGLISH_DICTIONARY_FITNESS
 
-    words = re.findall(r'[a-zA-Z]+', text.upper()) # 提取所有单词
+    if isinstance(text, CompiledText): words = text.words() # 预编译文本已记录单词边界
+    else: words = re.findall(r'[a-zA-Z]+', text.upper()) # 提取所有单词
     if not words: 
         return 0.0
 
@@ -161,7 +274,7 @@ def get_dictionary_score(text, weighting_scheme='linear'):
 
         total_potential_score += current_word_potential_score
 
-        if word in ENGLISH_DICTIONARY_FITNESS:
+        if word in dictionary:
             achieved_score += current_word_potential_score
             
     if total_potential_score == 0: # 避免除以零 (例如，如果所有词长度为0或权重方案导致0)
@@ -177,19 +290,31 @@ def calculate_fitness(text,
                       tri_weight=0.21,
                       quad_weight=0.38,
                       dict_weight=0.31, # 词典得分的整体权重
-                      dictionary_weighting_scheme='linear'): # 新增：词典内部单词长度的加权方案
+                      dictionary_weighting_scheme='linear', # 新增：词典内部单词长度的加权方案
+                      model=None): # 语言模型 (LanguageModel 或注册名)，None 时使用全局英文模型
     """
     计算给定文本的综合适应度分数。分数越高，代表文本越像自然英文。
+    text 可以是字符串或 CompiledText；字符串会先预编译一次，各项评分共用同一份结果。
+    字母按原字符归类：只有 A-Z/a-z 参与N-gram与词典评分，ı、ſ、ß 等大写后才像ASCII字母的字符与其他非ASCII字母一样
+    不匹配任何N-gram，也会切断单词 (早期版本把 ı、ſ 当作 I、S 计分，含这类字符的文本分数因此与之不同)。
     参数:
         dictionary_weighting_scheme (str): 传递给 get_dictionary_score 的词长加权方案。
                                            可选 'count', 'linear', 'quadratic'。
+        model (LanguageModel | str): 评分使用的语言模型，见 language_models。
     """
-    m_score = get_monogram_score(text)
-    b_score = get_bigram_score(text)
-    t_score = get_trigram_score(text)
-    q_score = get_quadgram_score(text)
+    text = compile_text(text)
+    model = _resolve_model(model)
+    if model is not None: tables = model.get_ngram_tables()[0]; scaling = model.get_table_scaling()
+    else: tables = NGRAM_TABLES; scaling = NGRAM_TABLE_SCALING
+    if len(text.codes) >= 4 and all(n in tables for n in (1, 2, 3, 4)) and OTHER_LETTER_CODE not in text.codes:
+        m_score, b_score, t_score, q_score = _score_all_ngram_orders(text.codes, tables, scaling)
+    else:
+        m_score = get_monogram_score(text, model)
+        b_score = get_bigram_score(text, model)
+        t_score = get_trigram_score(text, model)
+        q_score = get_quadgram_score(text, model)
     # 使用新的词典计分方法
-    d_score_normalized_percent = get_dictionary_score(text, weighting_scheme=dictionary_weighting_scheme)
+    d_score_normalized_percent = get_dictionary_score(text, weighting_scheme=dictionary_weighting_scheme, model=model)
     
     # N-gram得分是平均对数概率 (负数，越接近0越好)
     # d_score_normalized_percent 是0-100的规范化百分比 (越高越好)
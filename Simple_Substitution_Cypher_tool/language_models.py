@@ -0,0 +1,256 @@
+# language_models.py
+# 语言模型注册表：每种语言的N-gram表、字母频率与词典封装为一个模型对象，首次使用时加载，
+# 常驻内存的模型总量受内存预算约束，超出时按最近最少使用 (LRU) 顺序卸载
+
+import os
+import math
+import mmap
+import threading
+import collections
+
+import fitness
+import ngram_tables
+from english_stats import LETTER_FREQUENCIES as ENGLISH_LETTER_FREQUENCIES
+
+DEFAULT_MODEL_NAME = "english"
+DEFAULT_MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+NGRAM_TYPE_NAMES = {1: "monogram", 2: "bigram", 3: "trigram", 4: "quadgram"}
+_DICTIONARY_WORD_OVERHEAD_BYTES = 64 # 估算词典内存时每个单词的额外开销 (字符串对象与集合槽位)
+
+class LanguageModel:
+    """一种语言的评分模型，数据在首次使用时加载。
+    N-gram 数据来源 (三选一):
+        tables_path: build_ngram_model 输出的二进制表 (完整精度或 float32/int16 紧凑格式)，以只读内存映射打开，同一文件的页面在进程间共享。
+        ngram_paths: {阶数: 计数文件路径}，加载时编译为稠密表。
+        两者都不提供: 使用 fitness 模块的全局英文表 (可能已附加到共享内存)，该表常驻进程，不计入内存预算。
+    letter_frequencies ({'E': 12.7, ...}，单位%) 缺省时由1阶表推算；dictionary_path 缺省时使用内置默认词典。
+    """
+    def __init__(self, name, ngram_paths=None, tables_path=None, dictionary_path=None, letter_frequencies=None, version="1"):
+        self.name = name
+        self.version = str(version)
+        self.ngram_paths = dict(ngram_paths) if ngram_paths else None
+        self.tables_path = tables_path
+        self.dictionary_path = dictionary_path
+        self.uses_global_tables = not self.ngram_paths and not tables_path
+        self._explicit_letter_frequencies = dict(letter_frequencies) if letter_frequencies else None
+        self._lock = threading.Lock()
+        self._tables = None; self._min_log_probs = None; self._table_scaling = None; self._dictionary = None
+        self._letter_frequencies = None
+        self._registry = None # 所属注册表，加载/卸载时通知其更新LRU记录
+
+    @classmethod
+    def from_prefix(cls, name, directory, prefix=None, dictionary_path=None, letter_frequencies=None, version="1"):
+        """按 build_ngram_model 的输出命名 (如 prefix_quadgrams.txt、prefix_ngrams.bin) 创建模型，存在二进制表时优先使用。"""
+        prefix = prefix or name
+        tables_path = os.path.join(directory, f"{prefix}_ngrams.bin")
+        if os.path.exists(tables_path):
+            return cls(name, tables_path=tables_path, dictionary_path=dictionary_path, letter_frequencies=letter_frequencies, version=version)
+        ngram_paths = {n: os.path.join(directory, f"{prefix}_{type_name}s.txt") for n, type_name in NGRAM_TYPE_NAMES.items()}
+        return cls(name, ngram_paths=ngram_paths, dictionary_path=dictionary_path, letter_frequencies=letter_frequencies, version=version)
+
+    @property
+    def cache_token(self):
+        """标识模型及其数据版本的字符串，可用于结果缓存的键。"""
+        return f"{self.name}@{self.version}"
+
+    @property
+    def is_loaded(self):
+        return self._tables is not None
+
+    def _load_tables(self):
+        """按数据来源加载各阶稠密表，返回 (稠密表字典, 最小对数概率字典, 反量化参数字典)。"""
+        if self.uses_global_tables:
+            tables, min_log_probs = ngram_tables.ensure_fitness_tables_loaded()
+            return tables, min_log_probs, fitness.NGRAM_TABLE_SCALING
+        if self.tables_path:
+            with open(self.tables_path, 'rb') as f: # 表视图持有内存映射对象，无需另行保存
+                mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return ngram_tables.unpack_tables_from(mapped_file)
+        tables = {}; min_log_probs = {}
+        for n, type_name in NGRAM_TYPE_NAMES.items():
+            tables[n], min_log_probs[n] = fitness.read_ngram_table(self.ngram_paths.get(n, ""), n, type_name)
+        return tables, min_log_probs, {}
+
+    def _load_dictionary(self):
+        if self.uses_global_tables and self.dictionary_path is None:
+            if not fitness.FITNESS_DICTIONARY_LOADED: fitness.load_dictionary_for_fitness(ngram_tables.COMMON_WORDS_FILE_PATH)
+            return fitness.ENGLISH_DICTIONARY_FITNESS
+        if self.dictionary_path is None: return fitness.DEFAULT_FITNESS_WORDS
+        return fitness.read_dictionary_words(self.dictionary_path)
+
+    def load(self):
+        """加载模型数据 (已加载时直接返回)，返回 (稠密表字典, 最小对数概率字典)。"""
+        with self._lock:
+            if self._tables is not None: return self._tables, self._min_log_probs
+            tables, min_log_probs, scaling = self._load_tables()
+            self._dictionary = self._load_dictionary()
+            self._table_scaling = scaling
+            self._tables, self._min_log_probs = tables, min_log_probs
+        if not self.uses_global_tables: print(f"语言模型：已加载 '{self.cache_token}' (约 {self.memory_bytes() / 1024 / 1024:.1f} MB)。")
+        if self._registry is not None: self._registry._note_loaded(self)
+        return tables, min_log_probs
+
+    def _release(self):
+        """丢弃对已加载数据的引用。正在评分的调用方持有的表引用仍然有效，
+        其用完后数组随之回收；内存映射由其上的表视图持有，最后一个视图释放时解除映射。"""
+        with self._lock:
+            self._tables = None; self._min_log_probs = None; self._table_scaling = None; self._dictionary = None
+            self._letter_frequencies = None
+
+    def unload(self):
+        """卸载模型数据，下次使用时重新加载。"""
+        self._release()
+        if self._registry is not None: self._registry._note_unloaded(self)
+
+    def get_ngram_tables(self):
+        """返回 (稠密表字典, 最小对数概率字典)，未加载时先加载。"""
+        tables, min_log_probs = self._tables, self._min_log_probs
+        if tables is None: return self.load()
+        return tables, min_log_probs
+
+    def get_table_scaling(self):
+        """返回紧凑表的反量化参数 {n: (缩放系数, 偏移量)}，完整精度的阶数不在其中。"""
+        scaling = self._table_scaling
+        if scaling is None:
+            self.load(); scaling = self._table_scaling
+        return scaling if scaling is not None else {}
+
+    def get_dictionary(self):
+        """返回大写单词集合，未加载时先加载。"""
+        dictionary = self._dictionary
+        if dictionary is None:
+            self.load(); dictionary = self._dictionary
+        return dictionary if dictionary is not None else self._load_dictionary()
+
+    def get_letter_frequencies(self):
+        """返回 {大写字母: 频率(%)}；未显式提供时由1阶表的对数概率推算。"""
+        if self._explicit_letter_frequencies is not None: return self._explicit_letter_frequencies
+        frequencies = self._letter_frequencies
+        if frequencies is None:
+            monogram_table = self.get_ngram_tables()[0][1]
+            scale, offset = self.get_table_scaling().get(1, (1.0, 0.0))
+            frequencies = {chr(65 + code): math.exp(offset + scale * monogram_table[code]) * 100.0 for code in range(26)}
+            self._letter_frequencies = frequencies
+        return frequencies
+
+    def get_sorted_letter_frequencies(self):
+        """按频率降序排列的 [(字母, 频率), ...]，与 english_stats.SORTED_ENGLISH_FREQUENCIES 格式相同。"""
+        return sorted(self.get_letter_frequencies().items(), key=lambda item: item[1], reverse=True)
+
+    def memory_bytes(self):
+        """估算模型当前占用的内存字节数；使用全局表的模型常驻进程，计为0。"""
+        tables, dictionary = self._tables, self._dictionary
+        if tables is None or self.uses_global_tables: return 0
+        total = sum(len(table) * table.itemsize for table in tables.values())
+        if dictionary is not None: total += sum(len(word) + _DICTIONARY_WORD_OVERHEAD_BYTES for word in dictionary)
+        return total
+
+class ModelRegistry:
+    """按名称管理语言模型。模型在首次使用时加载；常驻模型的估算内存之和超过预算时，
+    按最近最少使用的顺序卸载其他模型 (刚加载的模型即使单独超出预算也会保留)。线程安全。"""
+    def __init__(self, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._models = {}
+        self._resident = collections.OrderedDict() # 模型名 -> 估算字节数，按最近使用排序 (末尾最新)
+        self._lock = threading.RLock()
+
+    def register(self, model, replace=False):
+        """注册模型；同名模型已存在且 replace 为 False 时抛出 ValueError。"""
+        with self._lock:
+            existing = self._models.get(model.name)
+            if existing is not None and existing is not model:
+                if not replace: raise ValueError(f"语言模型 '{model.name}' 已注册。")
+                self.unregister(model.name)
+            model._registry = self
+            self._models[model.name] = model
+            if model.is_loaded: self._note_loaded(model)
+        return model
+
+    def unregister(self, name):
+        with self._lock:
+            model = self._models.pop(name, None)
+            self._resident.pop(name, None)
+        if model is not None:
+            model._registry = None; model._release()
+
+    def names(self):
+        with self._lock: return sorted(self._models)
+
+    def get(self, name):
+        """返回已注册的模型并标记为最近使用；模型在首次取用其数据时加载。"""
+        with self._lock:
+            model = self._models.get(name)
+            if model is None: raise ValueError(f"未注册的语言模型: '{name}'。可用模型: {', '.join(sorted(self._models))}。")
+            if name in self._resident: self._resident.move_to_end(name)
+        return model
+
+    def resident_models(self):
+        """当前常驻的模型名，按最近使用排序 (最后一个最新)。"""
+        with self._lock: return list(self._resident)
+
+    def resident_bytes(self):
+        with self._lock: return sum(self._resident.values())
+
+    def evict(self, name):
+        """立即卸载指定模型。"""
+        with self._lock: model = self._models.get(name)
+        if model is not None: model.unload()
+
+    def _note_loaded(self, model):
+        with self._lock:
+            if self._models.get(model.name) is not model: return
+            self._resident[model.name] = model.memory_bytes()
+            self._resident.move_to_end(model.name)
+            victims = []
+            while sum(self._resident.values()) > self.memory_budget_bytes:
+                victim_name = next((name for name in self._resident if name != model.name), None)
+                if victim_name is None: break
+                del self._resident[victim_name]; victims.append(self._models[victim_name])
+        for victim in victims:
+            print(f"语言模型：内存预算不足，卸载最近最少使用的 '{victim.cache_token}'。")
+            victim._release()
+
+    def _note_unloaded(self, model):
+        with self._lock: self._resident.pop(model.name, None)
+
+DEFAULT_REGISTRY = ModelRegistry()
+DEFAULT_REGISTRY.register(LanguageModel(DEFAULT_MODEL_NAME, letter_frequencies=ENGLISH_LETTER_FREQUENCIES))
+
+def register_model(model, replace=False):
+    """向默认注册表注册模型。"""
+    return DEFAULT_REGISTRY.register(model, replace=replace)
+
+def get_model(name):
+    """从默认注册表取得模型。"""
+    return DEFAULT_REGISTRY.get(name)
+
+def parse_model_spec(spec):
+    """解析模型规格字符串 "名称=目录/前缀[@版本]" (前缀即 build_ngram_model 的 --prefix)，返回未加载的 LanguageModel。
+    规格是普通字符串，可经进程池 initializer 传给工作进程，在每个进程中注册同样的模型。"""
+    name, separator, location = str(spec).partition("=")
+    if "@" in location: location, _, version = location.rpartition("@")
+    else: version = "1"
+    name, location = name.strip(), location.strip()
+    if not separator or not name or not location: raise ValueError(f"模型规格格式错误: '{spec}'。应为 名称=目录/前缀[@版本]。")
+    directory, prefix = os.path.split(location)
+    model = LanguageModel.from_prefix(name, directory or ".", prefix, version=version.strip() or "1")
+    data_paths = [model.tables_path] if model.tables_path else list(model.ngram_paths.values())
+    missing_paths = [path for path in data_paths if not os.path.exists(path)]
+    if missing_paths: raise ValueError(f"模型 '{name}' 的数据文件不存在: {', '.join(missing_paths)}。")
+    return model
+
+def register_model_specs(model_specs, registry=None):
+    """按规格字符串向注册表 (默认为 DEFAULT_REGISTRY) 注册模型，同名模型被替换；返回注册的模型名列表。默认英文模型不可替换。"""
+    registry = registry or DEFAULT_REGISTRY
+    names = []
+    for spec in model_specs or ():
+        model = parse_model_spec(spec)
+        if model.name == DEFAULT_MODEL_NAME: raise ValueError(f"不能替换默认模型 '{DEFAULT_MODEL_NAME}'。")
+        registry.register(model, replace=True); names.append(model.name)
+    return names
+
+def resolve_model(model):
+    """把模型句柄 (None / 注册名 / LanguageModel) 解析为模型对象；None 解析为默认英文模型。"""
+    if model is None: return get_model(DEFAULT_MODEL_NAME)
+    if isinstance(model, str): return get_model(model)
+    return model
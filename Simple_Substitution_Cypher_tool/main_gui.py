@@ -7,6 +7,8 @@ import threading
 import string
 import os
 import re
+import bisect
+import sqlite3
 import collections
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,6 +19,7 @@ QUADGRAM_FILE_PATH = os.path.join(BASE_DIR, "english_quadgrams.txt")
 COMMON_WORDS_FILE_PATH = os.path.join(BASE_DIR, "common_words.txt")
 
 from cipher_logic import encrypt, decrypt, validate_key, PLAINTEXT_ALPHABET
+from compiled_text import compile_text
 from analysis_helpers import (
     get_letter_frequencies, apply_partial_key,
     generate_frequency_suggestions_data,
@@ -30,10 +33,12 @@ from fitness import (
     FITNESS_DICTIONARY_LOADED
 )
 from auto_solver import solve_simulated_annealing, generate_random_key # 导入 generate_random_key
+from result_cache import get_result_cache
 
 DEFAULT_WORDS_CONTENT = ["THE", "BE", "TO", "OF", "AND", "A", "IN", "THAT", "HAVE", "I",
                          "IT", "FOR", "NOT", "ON", "WITH", "HE", "AS", "YOU", "DO", "AT",
                          "THIS", "BUT", "HIS", "BY", "FROM", "ANSWER", "QUESTION", "SECRET", "MESSAGE"]
+MANUAL_PATCH_MAX_FRACTION = 0.3 # 手动破译视图：需修补的位置超过字母总数的此比例时 (如导入完整密钥) 改为整体重绘
 
 class CipherApp:
     """主应用程序类。"""
@@ -52,11 +57,15 @@ class CipherApp:
         if not ANALYSIS_DICTIONARY_LOADED: load_dictionary_for_analysis(COMMON_WORDS_FILE_PATH)
 
         self.current_manual_key_map = {}
+        self.manual_compiled_ciphertext = None # 手动破译密文的预编译形式，positions_by_letter 即按密文字母的位置索引
+        self.manual_line_starts = [0] # 密文各行首字符的下标，用于把字符下标换算为 Text 控件索引
+        self.manual_rendered_key_map = None # 解密视图当前显示所对应的密钥映射；None 表示需要整体重绘
         self.user_locked_mappings_for_auto = {} 
         self.overall_best_key_str = ""
         self.overall_best_score = -float('inf')
         self.overall_best_decrypted_text = ""
         self.auto_solver_master_thread = None 
+        self.auto_compiled_ciphertext = None # 当前自动破译任务的预编译密文，求解与结果渲染共用
         # self.auto_solver_stop_event = None # 停止事件已移除
         self.current_sa_run_best_score_log = -float('inf') 
 
@@ -200,8 +209,9 @@ class CipherApp:
         """加载密文进行手动分析。"""
         self.manual_full_key_entry.delete(0, tk.END); self.current_manual_key_map.clear()
         self.manual_cipher_char_entry.delete(0, tk.END); self.manual_plain_char_entry.delete(0, tk.END)
-        ciphertext = self.manual_cipher_input.get("1.0", tk.END).strip().upper()
-        if not ciphertext: messagebox.showinfo("提示", "请输入要分析的密文。"); return
+        self._compile_manual_ciphertext()
+        if self.manual_compiled_ciphertext is None: messagebox.showinfo("提示", "请输入要分析的密文。"); return
+        ciphertext = self.manual_compiled_ciphertext
         self.manual_freq_display.configure(state="normal"); self.manual_freq_display.delete("1.0", tk.END)
         self.manual_freq_display.insert(tk.END, "--- 密文字母频率 ---\n")
         cipher_freq = get_letter_frequencies(ciphertext)
@@ -217,6 +227,8 @@ class CipherApp:
         """设置单个密文到明文的映射。"""
         cipher_char = self.manual_cipher_char_entry.get().strip().upper(); plain_char = self.manual_plain_char_entry.get().strip().lower()
         if not (len(cipher_char) == 1 and cipher_char.isalpha() and len(plain_char) == 1 and plain_char.isalpha()): messagebox.showerror("输入错误", "请输入单个密文字母和单个明文字母进行映射。"); return
+        if not all(char in string.ascii_letters for char in self.manual_cipher_char_entry.get().strip() + self.manual_plain_char_entry.get().strip()): # 密钥与解密只代换 A-Z (ı、ſ 大写后才像ASCII字母，同样拒绝)
+            messagebox.showerror("输入错误", "只能映射英文字母 A-Z，非ASCII字母在解密时保持原样。"); return
         if plain_char in self.current_manual_key_map.values():
             conflicting_cipher = [k for k, v in self.current_manual_key_map.items() if v == plain_char][0]
             if conflicting_cipher != cipher_char:
@@ -236,13 +248,54 @@ class CipherApp:
             self.update_manual_decryption_and_key_status(); messagebox.showinfo("操作成功", f"密文字母 '{cipher_char_to_unset}' 的映射已取消。")
         else: messagebox.showinfo("提示", f"密文字母 '{cipher_char_to_unset}' 当前未被映射。")
 
-    def update_manual_decryption_and_key_status(self):
-        """更新手动破译界面的密钥状态和部分解密文本。"""
+    def _compile_manual_ciphertext(self):
+        """读取手动破译的密文并建立按密文字母的位置索引，清除密文框的修改标记。"""
         ciphertext = self.manual_cipher_input.get("1.0", tk.END).strip().upper()
+        self.manual_compiled_ciphertext = compile_text(ciphertext) if ciphertext else None
+        self.manual_line_starts = [0] + [match.end() for match in re.finditer("\n", ciphertext)]
+        self.manual_rendered_key_map = None
+        self.manual_cipher_input.edit_modified(False)
+
+    def _manual_text_index(self, position):
+        """把密文中的字符下标换算为 Text 控件的 "行.列" 索引 (解密视图与密文逐字符对齐)。"""
+        line = bisect.bisect_right(self.manual_line_starts, position)
+        return f"{line}.{position - self.manual_line_starts[line - 1]}"
+
+    def _show_manual_placeholder(self, placeholder):
+        self.manual_decrypted_text.configure(state="normal"); self.manual_decrypted_text.delete("1.0", tk.END)
+        self.manual_decrypted_text.insert("1.0", placeholder); self.manual_decrypted_text.configure(state="disabled")
+        self.manual_rendered_key_map = None
+
+    def _refresh_manual_decrypted_text(self):
+        """刷新部分解密视图：只在映射发生变化的密文字母的出现位置上原地替换字符，
+        首次显示或需修补的位置过多时整体重绘。"""
+        compiled_ciphertext = self.manual_compiled_ciphertext
+        if compiled_ciphertext is None: self._show_manual_placeholder("请输入密文以查看部分解密结果。"); return
+        key_map = self.current_manual_key_map; rendered_key_map = self.manual_rendered_key_map
+        positions_by_letter = compiled_ciphertext.positions_by_letter
+        changed_codes = [] if rendered_key_map is None else \
+            [code for code, cipher_char in enumerate(string.ascii_uppercase) if rendered_key_map.get(cipher_char) != key_map.get(cipher_char)]
+        patch_count = sum(len(positions_by_letter[code]) for code in changed_codes)
+        self.manual_decrypted_text.configure(state="normal")
+        if rendered_key_map is None or patch_count > len(compiled_ciphertext.codes) * MANUAL_PATCH_MAX_FRACTION:
+            self.manual_decrypted_text.delete("1.0", tk.END)
+            self.manual_decrypted_text.insert("1.0", apply_partial_key(compiled_ciphertext, key_map))
+        else:
+            for code in changed_codes:
+                new_char = key_map.get(string.ascii_uppercase[code], "_") # 已映射则用小写明文，否则用"_"
+                for position in positions_by_letter[code]:
+                    index = self._manual_text_index(position)
+                    self.manual_decrypted_text.replace(index, f"{index}+1c", new_char)
+        self.manual_decrypted_text.configure(state="disabled")
+        self.manual_rendered_key_map = dict(key_map)
+
+    def update_manual_decryption_and_key_status(self):
+        """更新手动破译界面的密钥状态和部分解密文本 (解密文本按位置索引增量修补)。"""
+        if self.manual_compiled_ciphertext is None or self.manual_cipher_input.edit_modified(): self._compile_manual_ciphertext() # 密文框被编辑过则重建索引
         self.manual_key_status_display.configure(state="normal"); self.manual_key_status_display.delete("1.0", tk.END)
-        if not ciphertext and not self.current_manual_key_map:
+        if self.manual_compiled_ciphertext is None and not self.current_manual_key_map:
             self.manual_key_status_display.insert("1.0", "请先输入密文并开始分析，或设置/导入密钥映射。")
-            self.manual_decrypted_text.configure(state="normal"); self.manual_decrypted_text.delete("1.0", tk.END); self.manual_decrypted_text.insert("1.0", "待部分解密的文本显示在此。"); self.manual_decrypted_text.configure(state="disabled")
+            self._show_manual_placeholder("待部分解密的文本显示在此。")
             self.manual_key_status_display.configure(state="disabled"); return
         if self.current_manual_key_map:
             self.manual_key_status_display.insert(tk.END, "当前密钥映射 (密文 -> 明文):\n")
@@ -253,10 +306,7 @@ class CipherApp:
         self.manual_key_status_display.insert(tk.END, f"\n未映射密文字母: {', '.join(unmapped_cipher_gui) or '无'}\n")
         self.manual_key_status_display.insert(tk.END, f"未用明文字母: {', '.join(unmapped_plain_gui) or '无'}\n")
         self.manual_key_status_display.configure(state="disabled")
-        self.manual_decrypted_text.configure(state="normal"); self.manual_decrypted_text.delete("1.0", tk.END)
-        if ciphertext: self.manual_decrypted_text.insert("1.0", apply_partial_key(ciphertext, self.current_manual_key_map))
-        else: self.manual_decrypted_text.insert("1.0", "请输入密文以查看部分解密结果。")
-        self.manual_decrypted_text.configure(state="disabled")
+        self._refresh_manual_decrypted_text()
     
     def create_auto_break_tab(self, tab):
         """创建“自动辅助破译”选项卡，包含多轮运行和日志。"""
@@ -270,6 +320,8 @@ class CipherApp:
         main_buttons_frame = ttk.Frame(tab); main_buttons_frame.pack(padx=10, pady=5, fill="x")
         run_params_frame = ttk.Frame(main_buttons_frame); run_params_frame.pack(side="left", padx=(0,10))
         ttk.Label(run_params_frame, text="执行轮次:").grid(row=0, column=0, sticky="w"); self.auto_num_reruns_entry = ttk.Entry(run_params_frame, width=5); self.auto_num_reruns_entry.grid(row=0, column=1, sticky="w"); self.auto_num_reruns_entry.insert(0, "10") # 默认10轮
+        self.auto_warm_start_var = tk.BooleanVar(value=False) # 热启动：从频率与常见N-gram推断的密钥出发，并以较低的初温退火
+        self.auto_warm_start_check = ttk.Checkbutton(run_params_frame, text="热启动初始密钥", variable=self.auto_warm_start_var); self.auto_warm_start_check.grid(row=0, column=2, sticky="w", padx=(10,0))
         self.auto_start_button = ttk.Button(main_buttons_frame, text="开始自动破译 (多轮)", command=self.start_master_solver_loop); self.auto_start_button.pack(side="left", padx=5)
         # self.auto_stop_button 已被移除
         self.auto_clear_task_button = ttk.Button(main_buttons_frame, text="清空当前任务结果和日志", command=self.clear_auto_decryption_task); self.auto_clear_task_button.pack(side="left", padx=15)
@@ -355,16 +407,42 @@ class CipherApp:
         self.auto_start_button.config(state="disabled")
         # self.auto_stop_button.config(state="normal") # 停止按钮已移除
         self.auto_locked_mappings_input.config(state="disabled") # 运行时不允许修改锁定映射
+        self.auto_warm_start_check.config(state="disabled")
+        self.auto_initial_key_strategy = "warm" if self.auto_warm_start_var.get() else "random" # 各轮沿用启动时的选择
+        self.auto_compiled_ciphertext = compile_text(ciphertext) # 各轮求解与结果渲染共用，避免重复归一化
         # self.auto_solver_stop_event = threading.Event() # 停止事件已移除
-
+        self.auto_progress_label.config(text="状态: 正在查询结果缓存...")
+        threading.Thread( # 缓存查询可能等待其他进程的写锁，不在界面线程中进行
+            target=self._cached_result_lookup_thread_target,
+            args=(num_reruns, self.auto_compiled_ciphertext, self.user_locked_mappings_for_auto), daemon=True).start()
+
+    def _cached_result_lookup_thread_target(self, num_reruns, ciphertext, locked_mappings_for_task):
+        """在单独线程中查询结果缓存，再回到界面线程决定采用缓存结果还是开始破译。"""
+        cached = None
+        result_cache = get_result_cache()
+        if result_cache is not None:
+            try: cached = result_cache.lookup(ciphertext, locked_mappings_for_task, min_runs=num_reruns)
+            except sqlite3.Error as e: self.root.after(0, self._add_to_auto_log, f"结果缓存查询失败: {e}\n")
+        self.root.after(0, self._offer_cached_result, cached, num_reruns, ciphertext, locked_mappings_for_task)
+
+    def _offer_cached_result(self, cached, num_reruns, ciphertext, locked_mappings_for_task):
+        """在界面线程中调用：命中缓存且用户选择采用时直接显示缓存的最优解，否则启动主控循环。"""
+        if cached is not None and messagebox.askyesno(
+                "发现缓存结果", f"此密文 (相同锁定映射) 已破译过：分数 {cached['score']:.4f}，共运行 {cached['runs_completed']} 轮。\n"
+                               "是否直接使用缓存结果？\n选择“否”将重新进行自动破译。"):
+            self.overall_best_score = cached["score"]; self.overall_best_key_str = cached["key"] # 之前的最优解可能属于另一段密文，不能与缓存结果比较
+            self._add_to_auto_log(f"使用缓存结果: 分数 {cached['score']:.4f}, 密钥: {cached['key'][:20]}...\n")
+            self._update_gui_after_all_runs_stopped("已使用缓存结果")
+            return
         self.auto_master_thread = threading.Thread(
             target=self._master_solver_loop_thread_target,
-            args=(num_reruns, ciphertext, self.user_locked_mappings_for_auto), daemon=True )
+            args=(num_reruns, ciphertext, locked_mappings_for_task), daemon=True )
         self.auto_master_thread.start()
 
     def _master_solver_loop_thread_target(self, num_reruns, ciphertext, locked_mappings_for_task):
         """在单独线程中执行多轮模拟退火的主控逻辑。"""
         # 此处不检查 stop_event，因为已移除
+        task_best_key_str, task_best_score = "", -float('inf') # 本次任务的最优解 (全程最优可能来自之前的密文，不能写入本密文的缓存)
         for run_num in range(1, num_reruns + 1):
             self.current_sa_run_best_score_log = -float('inf')
             self.root.after(0, lambda rn=run_num, nr=num_reruns: self.auto_progress_label.config(text=f"状态: 第 {rn}/{nr} 轮运行中..."))
@@ -373,12 +451,12 @@ class CipherApp:
             self.root.after(0, lambda: self.current_run_iteration_display.config(state="readonly"))
 
             run_key, _, run_score = solve_simulated_annealing(
-                ciphertext, locked_mappings_for_task, 
-                initial_temperature=10.0, cooling_rate=0.997, min_temperature=0.01,
-                max_iterations_per_run=100000, 
-                status_callback=self.update_single_sa_run_gui) # 移除了 stop_event
+                ciphertext, locked_mappings_for_task, # 退火参数与适应度权重按密文长度取自退火档案
+                status_callback=self.update_single_sa_run_gui, # 移除了 stop_event
+                initial_key_strategy=self.auto_initial_key_strategy)
             
             # 移除了对 stop_event 的检查
+            if run_score > task_best_score: task_best_key_str, task_best_score = run_key, run_score
             if run_score > self.overall_best_score:
                 self.overall_best_score = run_score; self.overall_best_key_str = run_key
                 self.root.after(0, self._update_overall_best_gui_display)
@@ -387,6 +465,11 @@ class CipherApp:
             else:
                 log_msg = f"轮次 {run_num}/{num_reruns} 完成。分数: {run_score:.4f} (未超越最优: {self.overall_best_score:.4f})\n"
                 self.root.after(0, self._add_to_auto_log, log_msg)
+        result_cache = get_result_cache()
+        if result_cache is not None:
+            try: result_cache.store(ciphertext, task_best_key_str, task_best_score, num_reruns, locked_mappings_for_task,
+                                    metadata={"num_reruns": num_reruns, "source": "gui"})
+            except sqlite3.Error as e: self.root.after(0, self._add_to_auto_log, f"结果缓存写入失败: {e}\n")
         self.root.after(0, self._update_gui_after_all_runs_stopped, f"完成全部 {num_reruns} 轮自动破译")
 
     def _update_overall_best_gui_display(self):
@@ -400,18 +483,20 @@ class CipherApp:
         if len(self.overall_best_key_str) == 26:
             for i_map in range(26):
                 if self.overall_best_key_str[i_map].isalpha(): current_full_key_map_cipher_to_plain[self.overall_best_key_str[i_map].upper()] = PLAINTEXT_ALPHABET[i_map]
-        original_ciphertext_for_display = self.auto_cipher_input.get("1.0", tk.END).strip()
-        for char_cipher_original_case in original_ciphertext_for_display:
-            char_cipher_upper = char_cipher_original_case.upper()
-            if char_cipher_upper.isalpha():
-                if char_cipher_upper in current_full_key_map_cipher_to_plain:
-                    plain_char = current_full_key_map_cipher_to_plain[char_cipher_upper]
-                    tag_to_apply = "auto_mapping"
-                    if char_cipher_upper in self.user_locked_mappings_for_auto and self.user_locked_mappings_for_auto[char_cipher_upper] == plain_char:
-                        tag_to_apply = "locked_mapping"
-                    self.overall_best_decrypted_text_display.insert(tk.END, plain_char.lower(), (tag_to_apply,))
-                else: self.overall_best_decrypted_text_display.insert(tk.END, "_", ("auto_mapping",))
-            else: self.overall_best_decrypted_text_display.insert(tk.END, char_cipher_original_case, ("auto_mapping",))
+        if self.auto_compiled_ciphertext is not None:
+            # 整段渲染后按锁定字母的位置索引切分为若干片段，一次插入并分别打上标签
+            rendered_text = apply_partial_key(self.auto_compiled_ciphertext, current_full_key_map_cipher_to_plain)
+            positions_by_letter = self.auto_compiled_ciphertext.positions_by_letter
+            locked_positions = sorted(position for cipher_char, plain_char in self.user_locked_mappings_for_auto.items()
+                                      if current_full_key_map_cipher_to_plain.get(cipher_char) == plain_char
+                                      for position in positions_by_letter[ord(cipher_char) - 65])
+            segments_with_tags = []; segment_start = 0
+            for position in locked_positions:
+                if position > segment_start: segments_with_tags += [rendered_text[segment_start:position], ("auto_mapping",)]
+                segments_with_tags += [rendered_text[position], ("locked_mapping",)]
+                segment_start = position + 1
+            segments_with_tags += [rendered_text[segment_start:], ("auto_mapping",)]
+            self.overall_best_decrypted_text_display.insert(tk.END, *segments_with_tags)
         self.overall_best_decrypted_text_display.config(state="disabled")
 
     def _add_to_auto_log(self, message):
@@ -425,6 +510,7 @@ class CipherApp:
         self.auto_start_button.config(state="normal")
         # self.auto_stop_button 已移除，无需操作
         self.auto_locked_mappings_input.config(state="normal") 
+        self.auto_warm_start_check.config(state="normal")
         self.auto_progress_label.config(text=f"状态: {final_status_message}")
         self._update_overall_best_gui_display() 
         messagebox.showinfo("自动破译任务结束", f"自动破译任务已处理完毕。\n最终状态：{final_status_message}")
@@ -0,0 +1,183 @@
+# ngram_tables.py
+# N-gram 稠密表的二进制格式、共享内存发布与只读内存映射，使多个破译工作进程共享同一份模型而无需各自加载
+
+import os
+import mmap
+import atexit
+import struct
+from array import array
+from multiprocessing import shared_memory
+
+import fitness
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MONOGRAM_FILE_PATH = os.path.join(BASE_DIR, "english_monograms.txt")
+BIGRAM_FILE_PATH = os.path.join(BASE_DIR, "english_bigrams.txt")
+TRIGRAM_FILE_PATH = os.path.join(BASE_DIR, "english_trigrams.txt")
+QUADGRAM_FILE_PATH = os.path.join(BASE_DIR, "english_quadgrams.txt")
+COMMON_WORDS_FILE_PATH = os.path.join(BASE_DIR, "common_words.txt")
+
+TABLE_ORDERS = (1, 2, 3, 4)
+TABLE_LENGTHS = {n: 26 ** n for n in TABLE_ORDERS}
+
+# 二进制布局: 魔数(8字节) + 各阶最小对数概率(4个小端double) + 各阶稠密表(本机字节序double，按阶数顺序紧密排列)
+BINARY_MAGIC = b"SSCNGD01"
+_HEADER_FORMAT = "<8s4d"
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+TABLES_TOTAL_BYTES = _HEADER_SIZE + 8 * sum(TABLE_LENGTHS.values())
+
+# 紧凑格式: 魔数(8字节) + 精度名(8字节，ASCII补零) + 各阶最小对数概率、缩放系数、偏移量(各4个小端double) + 各阶紧凑表。
+# 对数概率 = 偏移量 + 缩放系数 * 存储值；float32 的缩放系数为1、偏移量为0，int16 为按阶线性量化的无符号16位整数。
+COMPACT_BINARY_MAGIC = b"SSCNGQ01"
+_COMPACT_HEADER_FORMAT = "<8s8s12d"
+_COMPACT_HEADER_SIZE = struct.calcsize(_COMPACT_HEADER_FORMAT)
+TABLE_PRECISIONS = ("float64", "float32", "int16")
+_PRECISION_TYPECODES = {"float64": 'd', "float32": 'f', "int16": 'H'}
+_INT16_LEVELS = 65535
+
+_ATTACHED_BUFFERS = [] # 持有已附加的共享内存/内存映射对象，防止被回收导致表视图失效
+
+def _release_attached_buffers():
+    """进程退出前先释放表视图再关闭底层缓冲区，避免 SharedMemory/mmap 因仍有导出指针而报错。"""
+    for n, table in list(fitness.NGRAM_TABLES.items()):
+        if isinstance(table, memoryview):
+            del fitness.NGRAM_TABLES[n]; table.release()
+    while _ATTACHED_BUFFERS:
+        try: _ATTACHED_BUFFERS.pop().close()
+        except BufferError: pass
+
+atexit.register(_release_attached_buffers)
+
+def ensure_fitness_tables_loaded():
+    """确保本进程的适应度N-gram表已从默认数据文件加载，返回 (稠密表字典, 最小对数概率字典)。"""
+    if not fitness.MONOGRAMS_LOADED: fitness.load_monograms(MONOGRAM_FILE_PATH)
+    if not fitness.BIGRAMS_LOADED: fitness.load_bigrams(BIGRAM_FILE_PATH)
+    if not fitness.TRIGRAMS_LOADED: fitness.load_trigrams(TRIGRAM_FILE_PATH)
+    if not fitness.QUADGRAMS_LOADED: fitness.load_quadgrams(QUADGRAM_FILE_PATH)
+    return {n: fitness.NGRAM_TABLES[n] for n in TABLE_ORDERS}, fitness.get_min_log_probs()
+
+def tables_total_bytes(precision="float64"):
+    """指定精度下二进制表的总字节数。"""
+    if precision == "float64": return TABLES_TOTAL_BYTES
+    itemsize = array(_PRECISION_TYPECODES[precision]).itemsize
+    return _COMPACT_HEADER_SIZE + itemsize * sum(TABLE_LENGTHS.values())
+
+def _check_precision(precision):
+    if precision not in TABLE_PRECISIONS: raise ValueError(f"未知的表精度: '{precision}'。可选: {', '.join(TABLE_PRECISIONS)}。")
+
+def quantize_tables(tables, min_log_probs, precision, scaling=None):
+    """把各阶表转换为指定精度，返回 (紧凑表字典, 反量化参数字典 {n: (缩放系数, 偏移量)})。
+    scaling 为输入表自身的反量化参数 (输入已是紧凑表时)；float64 精度返回的参数字典为空。"""
+    _check_precision(precision)
+    scaling = scaling or {}
+    compact_tables = {}; compact_scaling = {}
+    for n in TABLE_ORDERS:
+        table = tables[n]
+        if len(table) != TABLE_LENGTHS[n]: raise ValueError(f"{n}阶表长度应为 {TABLE_LENGTHS[n]}，实际为 {len(table)}。")
+        if n in scaling: # 先还原为对数概率
+            scale, offset = scaling[n]
+            table = array('d', (offset + scale * value for value in table))
+        if precision == "float64":
+            compact_tables[n] = table if isinstance(table, array) and table.typecode == 'd' else array('d', table)
+        elif precision == "float32":
+            compact_tables[n] = array('f', table)
+        else:
+            low = min(min(table), min_log_probs[n]); high = max(table)
+            scale = (high - low) / _INT16_LEVELS if high > low else 1.0
+            compact_tables[n] = array('H', (round((value - low) / scale) for value in table))
+            compact_scaling[n] = (scale, low)
+    return compact_tables, compact_scaling
+
+def pack_tables_into(buffer, tables, min_log_probs, precision="float64", scaling=None):
+    """将各阶表按二进制布局写入可写缓冲区 (bytearray/共享内存/内存映射)。
+    precision 为 float64 时写完整精度格式，否则先量化再写紧凑格式；scaling 为输入表的反量化参数。"""
+    tables, compact_scaling = quantize_tables(tables, min_log_probs, precision, scaling)
+    mins = [min_log_probs[n] for n in TABLE_ORDERS]
+    if precision == "float64":
+        struct.pack_into(_HEADER_FORMAT, buffer, 0, BINARY_MAGIC, *mins); offset = _HEADER_SIZE
+    else:
+        scales = [compact_scaling.get(n, (1.0, 0.0))[0] for n in TABLE_ORDERS]
+        offsets = [compact_scaling.get(n, (1.0, 0.0))[1] for n in TABLE_ORDERS]
+        struct.pack_into(_COMPACT_HEADER_FORMAT, buffer, 0, COMPACT_BINARY_MAGIC, precision.encode('ascii'), *mins, *scales, *offsets)
+        offset = _COMPACT_HEADER_SIZE
+    view = memoryview(buffer)
+    for n in TABLE_ORDERS:
+        raw = memoryview(tables[n]).cast('B')
+        view[offset:offset + len(raw)] = raw
+        offset += len(raw)
+    view.release()
+
+def unpack_tables_from(buffer):
+    """从二进制布局的缓冲区 (完整精度或紧凑格式) 创建各阶表的零拷贝只读视图，
+    返回 (表字典, 最小对数概率字典, 反量化参数字典 {n: (缩放系数, 偏移量)})；完整精度与 float32 的参数字典为空。"""
+    magic = bytes(buffer[:8])
+    view = memoryview(buffer).toreadonly(); tables = {}
+    if magic == BINARY_MAGIC:
+        _, *min_values = struct.unpack_from(_HEADER_FORMAT, buffer, 0)
+        typecode = 'd'; offset = _HEADER_SIZE; scaling = {}
+    elif magic == COMPACT_BINARY_MAGIC:
+        _, precision_raw, *values = struct.unpack_from(_COMPACT_HEADER_FORMAT, buffer, 0)
+        precision = precision_raw.rstrip(b"\0").decode('ascii')
+        _check_precision(precision)
+        typecode = _PRECISION_TYPECODES[precision]; offset = _COMPACT_HEADER_SIZE
+        min_values, scales, offsets = values[0:4], values[4:8], values[8:12]
+        scaling = {n: (scales[i], offsets[i]) for i, n in enumerate(TABLE_ORDERS)} if precision == "int16" else {}
+    else: raise ValueError("不是有效的N-gram二进制表 (魔数不匹配)。")
+    itemsize = array(typecode).itemsize
+    for n in TABLE_ORDERS:
+        nbytes = itemsize * TABLE_LENGTHS[n]
+        tables[n] = view[offset:offset + nbytes].cast(typecode)
+        offset += nbytes
+    return tables, dict(zip(TABLE_ORDERS, min_values)), scaling
+
+def create_shared_ngram_tables(name=None, precision="float64"):
+    """在父进程中把已加载的N-gram表发布到操作系统共享内存，precision 可选 float32/int16 以缩小工作集。
+    返回 SharedMemory 对象，其 name 传给工作进程；使用完毕后由父进程负责 close() 和 unlink()。"""
+    _check_precision(precision)
+    tables, min_log_probs = ensure_fitness_tables_loaded()
+    shm = shared_memory.SharedMemory(name=name, create=True, size=tables_total_bytes(precision))
+    pack_tables_into(shm.buf, tables, min_log_probs, precision, fitness.get_table_scaling())
+    return shm
+
+def _open_shared_memory_untracked(name):
+    """附加到已有共享内存块；所有权归创建它的父进程，本进程只读不负责回收。"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        # 旧版本会向资源跟踪器重复登记；由同一父进程启动的工作进程共用其跟踪器，重复登记不会产生副作用
+        return shared_memory.SharedMemory(name=name)
+
+def attach_shared_ngram_tables(name):
+    """在工作进程中附加父进程发布的共享内存N-gram表，并安装到 fitness 模块 (不复制数据)。"""
+    shm = _open_shared_memory_untracked(name)
+    tables, min_log_probs, scaling = unpack_tables_from(shm.buf)
+    fitness.install_ngram_tables(tables, min_log_probs, scaling)
+    _ATTACHED_BUFFERS.append(shm)
+
+def save_ngram_tables(filepath, tables=None, min_log_probs=None, precision="float64", scaling=None):
+    """把N-gram表保存为二进制表文件 (precision 见 TABLE_PRECISIONS)，可供 attach_ngram_tables_file 以只读内存映射方式加载。"""
+    _check_precision(precision)
+    if tables is None:
+        tables, min_log_probs = ensure_fitness_tables_loaded(); scaling = fitness.get_table_scaling()
+    buffer = bytearray(tables_total_bytes(precision))
+    pack_tables_into(buffer, tables, min_log_probs, precision, scaling)
+    with open(filepath, 'wb') as f: f.write(buffer)
+
+def map_ngram_tables_file(filepath):
+    """以只读内存映射打开二进制表文件，返回 (表字典, 最小对数概率字典, 反量化参数字典)；同一文件的页面由操作系统在进程间共享。"""
+    with open(filepath, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _ATTACHED_BUFFERS.append(mapped)
+    return unpack_tables_from(mapped)
+
+def attach_ngram_tables_file(filepath):
+    """以只读内存映射加载二进制表文件并安装到 fitness 模块。"""
+    tables, min_log_probs, scaling = map_ngram_tables_file(filepath)
+    fitness.install_ngram_tables(tables, min_log_probs, scaling)
+
+def init_solver_worker(shared_tables_name=None, tables_filepath=None, dictionary_filepath=COMMON_WORDS_FILE_PATH):
+    """多进程池 (multiprocessing.Pool / ProcessPoolExecutor) 的 initializer：附加共享表或映射表文件，并加载词典。"""
+    if shared_tables_name: attach_shared_ngram_tables(shared_tables_name)
+    elif tables_filepath: attach_ngram_tables_file(tables_filepath)
+    else: ensure_fitness_tables_loaded()
+    if not fitness.FITNESS_DICTIONARY_LOADED: fitness.load_dictionary_for_fitness(dictionary_filepath)
@@ -0,0 +1,200 @@
+# result_cache.py
+# 破译结果缓存：以规范化密文 (字母按首次出现顺序重新编号，与加密所用的具体密钥无关)、锁定映射、语言模型版本
+# 与实际生效的退火日程和适应度权重 (分数只在同一组权重下可比) 的哈希为键，
+# 把最优解、分数与运行信息保存在 SQLite 文件中。启用 WAL 日志，多个工作进程可并发读写；条目数超出上限时按最近使用时间淘汰
+
+import os
+import json
+import time
+import string
+import sqlite3
+import hashlib
+import threading
+import contextlib
+
+from compiled_text import CompiledText, compile_text
+from cipher_logic import decrypt_compiled
+from language_models import resolve_model
+from annealing_profiles import SCHEDULE_PARAM_NAMES, select_profile, validate_fitness_weights
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, "solve_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_BUSY_TIMEOUT_SECONDS = 10.0 # 其他进程持有写锁时的最长等待时间
+CACHE_FORMAT_VERSION = 2 # 规范化规则、键的组成或表结构变化时递增，旧条目随之失效
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solve_results (
+    cache_key TEXT PRIMARY KEY,
+    model_token TEXT NOT NULL,
+    plain_by_label TEXT NOT NULL,
+    score REAL NOT NULL,
+    runs_completed INTEGER NOT NULL,
+    num_letters INTEGER NOT NULL,
+    metadata TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS solve_results_last_access ON solve_results (last_access);
+"""
+
+def canonicalize_ciphertext(ciphertext):
+    """返回 (规范化文本, 编号字母表)。
+    ASCII字母按首次出现的顺序依次改写为 a、b、c…，因此同一明文无论用哪个密钥加密，规范化结果都相同；
+    其他字母写作 '#'，其余字符的连续片段写作一个空格 (只保留影响适应度的单词边界)。
+    编号字母表的第 i 个字符是编号 i 对应的密文字母 (大写)。ciphertext 可以是字符串或 CompiledText。"""
+    text = ciphertext.template if isinstance(ciphertext, CompiledText) else str(ciphertext)
+    label_letters = []; labels = {}; output = []
+    for char in text.strip():
+        if char in string.ascii_letters:
+            upper_char = char.upper()
+            if upper_char not in labels:
+                labels[upper_char] = string.ascii_lowercase[len(label_letters)]; label_letters.append(upper_char)
+            output.append(labels[upper_char])
+        elif char.isalpha(): output.append("#")
+        elif not output or output[-1] != " ": output.append(" ")
+    return "".join(output), "".join(label_letters)
+
+def _canonical_locks(user_locked_mappings, label_letters):
+    """锁定映射的规范形式：密文中出现的字母换成其编号 (小写)，未出现的字母保留原样 (大写)，它们同样约束可用的明文字母。"""
+    labels = {cipher_char: string.ascii_lowercase[index] for index, cipher_char in enumerate(label_letters)}
+    return ",".join(sorted(f"{labels.get(cipher_char.upper(), cipher_char.upper())}={plain_char.lower()}"
+                           for cipher_char, plain_char in (user_locked_mappings or {}).items()))
+
+def effective_solver_config(num_letters, solver_params=None):
+    """返回按字母数选出的退火档案与 solver_params 中显式给出的退火参数、fitness_weights 合并后的实际生效配置。
+    档案文件重新调优后生效配置随之改变，旧条目因此不再命中。
+    initial_key_strategy 与 staged 有意不计入：它们只改变搜索路径，不改变适应度函数，最终分数都按同一组权重在全文上计算，
+    因此不同策略的结果可以直接比较，缓存保存其中分数最高者。"""
+    solver_params = solver_params or {}
+    profile = select_profile(num_letters)
+    config = {name: solver_params[name] if solver_params.get(name) is not None else profile[name] for name in SCHEDULE_PARAM_NAMES}
+    config["fitness_weights"] = validate_fitness_weights(solver_params.get("fitness_weights"), profile["fitness_weights"])
+    return config
+
+def make_cache_key(ciphertext, user_locked_mappings=None, model=None, solver_params=None):
+    """计算缓存键，返回 (键, 编号字母表)。solver_params 为传给 solve_simulated_annealing 的退火参数与 fitness_weights。"""
+    canonical_text, label_letters = canonicalize_ciphertext(ciphertext)
+    solver_config = effective_solver_config(len(compile_text(ciphertext).codes), solver_params)
+    digest_input = "\n".join((str(CACHE_FORMAT_VERSION), resolve_model(model).cache_token,
+                              json.dumps(solver_config, sort_keys=True),
+                              _canonical_locks(user_locked_mappings, label_letters), canonical_text))
+    return hashlib.sha256(digest_input.encode("utf-8")).hexdigest(), label_letters
+
+def _plain_by_label(key, label_letters):
+    """把密钥 (key[i] 为明文第i个字母对应的密文字母) 改写为各编号对应的明文字母串。"""
+    plain_for_cipher = {cipher_char.upper(): string.ascii_lowercase[plain_index] for plain_index, cipher_char in enumerate(key)}
+    return "".join(plain_for_cipher[cipher_char] for cipher_char in label_letters)
+
+def _rebuild_key(plain_by_label, label_letters, user_locked_mappings=None):
+    """由各编号对应的明文字母与本次密文的编号字母表还原密钥；密文中未出现的字母先满足锁定映射，其余按字母顺序补齐。"""
+    cipher_for_plain = [''] * 26
+    for cipher_char, plain_char in zip(label_letters, plain_by_label): cipher_for_plain[ord(plain_char) - 97] = cipher_char
+    used_cipher_chars = set(label_letters)
+    for cipher_char, plain_char in (user_locked_mappings or {}).items():
+        cipher_char, plain_index = cipher_char.upper(), ord(plain_char.lower()) - 97
+        if cipher_char not in used_cipher_chars and not cipher_for_plain[plain_index]:
+            cipher_for_plain[plain_index] = cipher_char; used_cipher_chars.add(cipher_char)
+    remaining_cipher_chars = iter(char for char in string.ascii_uppercase if char not in used_cipher_chars)
+    return "".join(cipher_char or next(remaining_cipher_chars) for cipher_char in cipher_for_plain)
+
+class ResultCache:
+    """基于 SQLite 的破译结果缓存。每个线程 (及每个进程) 使用独立的连接，写操作在 BEGIN IMMEDIATE 事务中进行。"""
+    def __init__(self, filepath=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, timeout=DEFAULT_BUSY_TIMEOUT_SECONDS):
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid(): # fork 出的子进程不能沿用父进程的连接
+            connection = sqlite3.connect(self.filepath, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL") # 读者不阻塞写者，适合多进程并发访问
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE") # 事务开始即取得写锁，避免读锁升级时的死锁
+        try: yield connection
+        except BaseException:
+            connection.execute("ROLLBACK"); raise
+        else: connection.execute("COMMIT")
+
+    def lookup(self, ciphertext, user_locked_mappings=None, model=None, solver_params=None, min_runs=1):
+        """查询缓存。命中时返回 {"key", "plaintext", "score", "runs_completed", "metadata", "created_at"}，
+        其中密钥与明文已换算到本次密文所用的密钥；未命中或条目的运行轮次少于 min_runs 时返回 None。"""
+        cache_key, label_letters = make_cache_key(ciphertext, user_locked_mappings, model, solver_params)
+        with self._transaction() as connection:
+            row = connection.execute("SELECT plain_by_label, score, runs_completed, metadata, created_at FROM solve_results WHERE cache_key = ?",
+                                     (cache_key,)).fetchone()
+            if row is None or row[2] < min_runs: return None
+            connection.execute("UPDATE solve_results SET last_access = ?, hits = hits + 1 WHERE cache_key = ?", (time.time(), cache_key))
+        plain_by_label, score, runs_completed, metadata, created_at = row
+        key = _rebuild_key(plain_by_label, label_letters, user_locked_mappings)
+        return {"key": key, "plaintext": decrypt_compiled(compile_text(ciphertext), key).render(), "score": score,
+                "runs_completed": runs_completed, "metadata": json.loads(metadata), "created_at": created_at}
+
+    def store(self, ciphertext, key, score, runs_completed, user_locked_mappings=None, model=None, metadata=None, solver_params=None):
+        """保存破译结果 (调用方只应保存完整结束的任务)。已有条目在新分数更高时替换最优解，
+        运行轮次取两者中较大者 (同一配置下至少已运行这么多轮)。返回是否写入。"""
+        cache_key, label_letters = make_cache_key(ciphertext, user_locked_mappings, model, solver_params)
+        if len(key) != 26 or score is None or not label_letters: return False
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute( # SET 中引用的 solve_results 列均为更新前的值
+                "INSERT INTO solve_results (cache_key, model_token, plain_by_label, score, runs_completed, num_letters, metadata, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (cache_key) DO UPDATE SET "
+                "plain_by_label = CASE WHEN excluded.score > solve_results.score THEN excluded.plain_by_label ELSE solve_results.plain_by_label END, "
+                "metadata = CASE WHEN excluded.score > solve_results.score THEN excluded.metadata ELSE solve_results.metadata END, "
+                "created_at = CASE WHEN excluded.score > solve_results.score THEN excluded.created_at ELSE solve_results.created_at END, "
+                "score = MAX(excluded.score, solve_results.score), runs_completed = MAX(excluded.runs_completed, solve_results.runs_completed), "
+                "last_access = excluded.last_access "
+                "WHERE excluded.score > solve_results.score OR excluded.runs_completed > solve_results.runs_completed",
+                (cache_key, resolve_model(model).cache_token, _plain_by_label(key, label_letters), float(score), int(runs_completed),
+                 len(compile_text(ciphertext).codes), json.dumps(metadata or {}, ensure_ascii=False), now, now))
+            stored = cursor.rowcount > 0
+            if stored: self._evict(connection)
+        return stored
+
+    def _evict(self, connection):
+        """条目数超过上限时删除最久未使用的条目 (在调用方的写事务中执行)。"""
+        excess = connection.execute("SELECT COUNT(*) FROM solve_results").fetchone()[0] - self.max_entries
+        if excess > 0:
+            connection.execute("DELETE FROM solve_results WHERE cache_key IN "
+                               "(SELECT cache_key FROM solve_results ORDER BY last_access ASC LIMIT ?)", (excess,))
+
+    def stats(self):
+        """返回 {"entries": 条目数, "hits": 累计命中次数}。"""
+        entries, hits = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM solve_results").fetchone()
+        return {"entries": entries, "hits": hits}
+
+    def clear(self):
+        with self._transaction() as connection: connection.execute("DELETE FROM solve_results")
+
+    def close(self):
+        """关闭当前线程的连接。"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close(); self._local.connection = None
+
+_DEFAULT_CACHES = {} # 文件路径 -> ResultCache (每个进程一份)
+_DEFAULT_CACHES_LOCK = threading.Lock()
+
+def get_result_cache(filepath=DEFAULT_CACHE_PATH):
+    """返回指定文件的共享缓存对象；filepath 为 None 或无法打开时返回 None (打印警告，调用方照常破译)。
+    查询与写入可能等待其他进程释放写锁 (最长 DEFAULT_BUSY_TIMEOUT_SECONDS)，界面线程不应直接调用。"""
+    if filepath is None: return None
+    with _DEFAULT_CACHES_LOCK:
+        if filepath not in _DEFAULT_CACHES:
+            try: _DEFAULT_CACHES[filepath] = ResultCache(filepath)
+            except sqlite3.Error as e:
+                print(f"结果缓存警告：无法打开 '{filepath}' ({e})。将不使用缓存。")
+                _DEFAULT_CACHES[filepath] = None
+        return _DEFAULT_CACHES[filepath]
@@ -0,0 +1,303 @@
+# solve_service.py
+# 本地常驻破译服务：预热N-gram模型并通过共享内存供工作进程池复用，以HTTP接口接收加密/解密/自动破译任务
+
+import os
+import json
+import time
+import queue
+import signal
+import argparse
+import itertools
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import ngram_tables
+from solver_jobs import init_job_worker, run_job_in_worker, validate_job_params
+from language_models import register_model_specs
+from result_cache import DEFAULT_CACHE_PATH
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE_SIZE = 64
+LATENCY_WINDOW_SIZE = 500 # 延迟统计所用的最近完成任务数
+MAX_EVENTS_PER_JOB = 2000 # 每个任务保留的进度事件上限
+DEFAULT_FINISHED_JOB_TTL_SECONDS = 600.0 # 已结束任务 (含结果与进度事件) 的保留时间，过期后查询返回404
+DEFAULT_MAX_FINISHED_JOBS = 1000 # 同时保留的已结束任务数上限，超出时先移除最早结束的
+
+class SolveJob:
+    """服务中的一个任务及其状态、进度事件与计时信息。"""
+    def __init__(self, job_id, kind, params, priority):
+        self.job_id = job_id
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.status = "queued" # queued / running / done / failed / cancelled
+        self.result = None
+        self.error = None
+        self.events = []
+        self.events_dropped = 0 # 因超出上限被丢弃的最早事件数
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self):
+        return {"job_id": self.job_id, "kind": self.kind, "priority": self.priority, "status": self.status,
+                "result": self.result, "error": self.error, "submitted_at": self.submitted_at,
+                "started_at": self.started_at, "finished_at": self.finished_at,
+                "latest_progress": self.events[-1] if self.events else None}
+
+class SolveService:
+    """管理有界优先级队列、工作进程池、进度转发与运行指标。"""
+    def __init__(self, num_workers=None, max_queue_size=DEFAULT_MAX_QUEUE_SIZE, table_precision="float64", cache_path=DEFAULT_CACHE_PATH,
+                 finished_job_ttl_seconds=DEFAULT_FINISHED_JOB_TTL_SECONDS, max_finished_jobs=DEFAULT_MAX_FINISHED_JOBS, model_specs=()):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.max_queue_size = max_queue_size
+        self.finished_job_ttl_seconds = finished_job_ttl_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self.started_at = time.time()
+        self.model_specs = tuple(model_specs)
+        self.model_names = register_model_specs(self.model_specs) # 父进程只登记 (不加载)，用于提交时校验模型名
+        self.shared_tables = ngram_tables.create_shared_ngram_tables(precision=table_precision) # 父进程只加载一次模型
+        mp_context = multiprocessing.get_context("spawn")
+        self.manager = mp_context.Manager()
+        self.cancelled_jobs = self.manager.dict() # 工作进程在检查点查询
+        self.progress_queue = mp_context.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=mp_context, initializer=init_job_worker,
+                                            initargs=(self.shared_tables.name, self.progress_queue, self.cancelled_jobs, cache_path, self.model_specs))
+        self.pending_jobs = queue.PriorityQueue() # 排队中被取消的任务留在此处由分发线程跳过，容量只按仍在排队的任务计算
+        self.queued_job_count = 0
+        self.jobs = {}
+        self.finished_jobs = collections.deque() # (结束时间, 任务ID)，按结束顺序排列，用于过期清理
+        self.condition = threading.Condition() # 保护任务状态与指标，并唤醒等待进度的流式请求
+        self.job_id_counter = itertools.count(1)
+        self.sequence_counter = itertools.count() # 同优先级按提交顺序出队
+        self.counters = collections.Counter()
+        self.recent_latencies = collections.deque(maxlen=LATENCY_WINDOW_SIZE) # (排队等待秒, 执行秒)
+        self.running = True
+        self.threads = [threading.Thread(target=self._dispatch_loop, daemon=True) for _ in range(self.num_workers)]
+        self.threads.append(threading.Thread(target=self._progress_pump_loop, daemon=True))
+        for thread in self.threads: thread.start()
+
+    def submit(self, kind, params, priority=0):
+        """提交任务；priority 越大越优先。队列已满时抛出 queue.Full。"""
+        params = validate_job_params(kind, params) # 未注册的模型名、非法数值参数等在此返回400，而不是排队后在工作进程中失败
+        try:
+            if isinstance(priority, bool): raise TypeError
+            priority = int(priority)
+        except (TypeError, ValueError, OverflowError): raise ValueError("priority 必须是整数。")
+        job = SolveJob(str(next(self.job_id_counter)), kind, params, priority) # 参数全部合法后才占用任务ID
+        with self.condition:
+            self._prune_finished_jobs()
+            if self.queued_job_count >= self.max_queue_size:
+                self.counters["rejected"] += 1; raise queue.Full
+            self.pending_jobs.put_nowait((-job.priority, next(self.sequence_counter), job))
+            self.queued_job_count += 1
+            self.jobs[job.job_id] = job; self.counters["submitted"] += 1
+        return job
+
+    def _retire_job(self, job):
+        """记录任务结束 (调用方持有 self.condition)，并清理过期或超出数量上限的已结束任务。"""
+        self.finished_jobs.append((job.finished_at, job.job_id))
+        self._prune_finished_jobs()
+
+    def _prune_finished_jobs(self):
+        expire_before = time.time() - self.finished_job_ttl_seconds
+        while self.finished_jobs and (len(self.finished_jobs) > self.max_finished_jobs or self.finished_jobs[0][0] < expire_before):
+            _, job_id = self.finished_jobs.popleft()
+            self.jobs.pop(job_id, None)
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务直接标记取消，运行中的任务在下一个检查点终止。返回任务或 None。"""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.is_finished(): return job
+            if job.status == "queued":
+                job.status = "cancelled"; job.finished_at = time.time(); self.counters["cancelled"] += 1
+                self.queued_job_count -= 1; self._retire_job(job)
+                self.condition.notify_all()
+            else: self.cancelled_jobs[job_id] = True
+            return job
+
+    def _dispatch_loop(self):
+        """分发线程：从优先级队列取任务交给进程池并等待结果，线程数等于工作进程数以限制并发。"""
+        while self.running:
+            try: _, _, job = self.pending_jobs.get(timeout=0.5)
+            except queue.Empty: continue
+            with self.condition:
+                if job.status != "queued": continue # 排队中已取消
+                job.status = "running"; job.started_at = time.time(); self.queued_job_count -= 1
+            try:
+                result = self.executor.submit(run_job_in_worker, job.job_id, job.kind, job.params).result()
+                outcome, error = ("cancelled" if result.get("stop_reason") == "cancelled" else "done"), None
+            except Exception as e:
+                result, outcome, error = None, "failed", str(e)
+            with self.condition:
+                job.result, job.error, job.status, job.finished_at = result, error, outcome, time.time()
+                self.counters["completed" if outcome == "done" else outcome] += 1
+                if result is not None and result.get("stop_reason") == "cached": self.counters["cache_hits"] += 1
+                self.recent_latencies.append((job.started_at - job.submitted_at, job.finished_at - job.started_at))
+                self.cancelled_jobs.pop(job.job_id, None)
+                self._retire_job(job)
+                self.condition.notify_all()
+
+    def _progress_pump_loop(self):
+        """把工作进程写入的进度事件转发到对应任务，并唤醒流式请求。"""
+        while self.running:
+            try: event = self.progress_queue.get(timeout=0.5)
+            except queue.Empty: continue
+            except (EOFError, OSError): break
+            with self.condition:
+                job = self.jobs.get(event.get("job_id"))
+                if job is None: continue
+                job.events.append(event)
+                if len(job.events) > MAX_EVENTS_PER_JOB:
+                    overflow = len(job.events) - MAX_EVENTS_PER_JOB
+                    del job.events[:overflow]; job.events_dropped += overflow
+                self.condition.notify_all()
+
+    def iter_job_events(self, job, heartbeat_seconds=5.0):
+        """逐个产出任务的进度事件，任务结束时产出最终状态后停止；长时间无事件时产出心跳 (None)。"""
+        cursor = 0 # 已产出事件的绝对序号；事件被截断时从现存的最早事件继续
+        while True:
+            with self.condition:
+                if job.events_dropped + len(job.events) <= cursor and not job.is_finished():
+                    self.condition.wait(timeout=heartbeat_seconds)
+                new_events = job.events[max(cursor - job.events_dropped, 0):]
+                cursor = job.events_dropped + len(job.events)
+                finished = job.is_finished()
+                final_state = job.to_dict() if finished else None
+            if not new_events and not finished: yield None
+            for event in new_events: yield {"type": "progress", **event}
+            if finished:
+                yield {"type": "finished", **final_state}; return
+
+    def metrics(self):
+        """返回吞吐量、延迟、队列深度等运行指标。"""
+        with self.condition:
+            latencies = list(self.recent_latencies)
+            statuses = collections.Counter(job.status for job in self.jobs.values())
+            counters = dict(self.counters)
+        uptime = time.time() - self.started_at
+        def summarize(values):
+            if not values: return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+            ordered = sorted(values)
+            return {"count": len(ordered), "mean": sum(ordered) / len(ordered), "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], "max": ordered[-1]}
+        return {"uptime_seconds": uptime, "workers": self.num_workers,
+                "queue_depth": statuses.get("queued", 0), "queue_capacity": self.max_queue_size,
+                "running": statuses.get("running", 0), "counters": counters,
+                "throughput_jobs_per_second": counters.get("completed", 0) / uptime if uptime > 0 else 0.0,
+                "latency_seconds": {"queue_wait": summarize([w for w, _ in latencies]),
+                                    "execution": summarize([r for _, r in latencies]),
+                                    "total": summarize([w + r for w, r in latencies])}}
+
+    def shutdown(self):
+        """停止分发并释放进程池、管理进程与共享内存。"""
+        self.running = False
+        for job_id in list(self.jobs): self.cancel(job_id)
+        self.executor.shutdown(wait=True)
+        self.manager.shutdown()
+        self.shared_tables.close(); self.shared_tables.unlink()
+
+class SolveRequestHandler(BaseHTTPRequestHandler):
+    """HTTP接口:
+        POST   /jobs              提交任务 {"kind": "solve", "params": {...}, "priority": 0}
+        GET    /jobs/<id>         查询任务状态与结果
+        GET    /jobs/<id>/events  以NDJSON流式返回进度事件，直到任务结束
+        DELETE /jobs/<id>         取消任务
+        GET    /metrics           吞吐量与延迟指标
+    """
+    service = None # 由 run_server 绑定
+
+    def _send_json(self, status_code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def _job_from_path(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "jobs": return None, parts
+        return self.service.jobs.get(parts[1]), parts
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs": self._send_json(404, {"error": "未知路径。"}); return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.service.submit(request.get("kind"), request.get("params", {}), request.get("priority", 0))
+        except queue.Full: self._send_json(429, {"error": "任务队列已满，请稍后重试。"}); return
+        except (ValueError, TypeError, AttributeError) as e: self._send_json(400, {"error": str(e)}); return
+        self._send_json(202, {"job_id": job.job_id, "status": job.status})
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics": self._send_json(200, self.service.metrics()); return
+        job, parts = self._job_from_path()
+        if job is None: self._send_json(404, {"error": "任务不存在。"}); return
+        if len(parts) == 2: self._send_json(200, job.to_dict()); return
+        if len(parts) == 3 and parts[2] == "events": self._stream_events(job); return
+        self._send_json(404, {"error": "未知路径。"})
+
+    def do_DELETE(self):
+        job, parts = self._job_from_path()
+        if job is None or len(parts) != 2: self._send_json(404, {"error": "任务不存在。"}); return
+        self.service.cancel(job.job_id)
+        self._send_json(200, {"job_id": job.job_id, "status": job.status})
+
+    def _stream_events(self, job):
+        """以换行分隔的JSON逐条写出进度事件，连接关闭即结束 (心跳为空行)。"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            for event in self.service.iter_job_events(job):
+                line = b"\n" if event is None else json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n"
+                self.wfile.write(line); self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError): pass
+
+    def log_message(self, format, *args):
+        pass # 保持控制台整洁，指标通过 /metrics 查看
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_server(host=DEFAULT_HOST, port=DEFAULT_PORT, num_workers=None, max_queue_size=DEFAULT_MAX_QUEUE_SIZE, table_precision="float64",
+               cache_path=DEFAULT_CACHE_PATH, model_specs=()):
+    """启动常驻破译服务，直到收到 Ctrl+C 或 SIGTERM。"""
+    handler_class = type("BoundSolveRequestHandler", (SolveRequestHandler,), {})
+    server = ThreadingHTTPServer((host, port), handler_class) # 先绑定端口，失败时不会留下已发布的共享内存
+    server.daemon_threads = True
+    service = SolveService(num_workers=num_workers, max_queue_size=max_queue_size, table_precision=table_precision, cache_path=cache_path,
+                           model_specs=model_specs)
+    handler_class.service = service
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    print(f"破译服务已启动：http://{host}:{server.server_address[1]} (工作进程 {service.num_workers} 个，队列容量 {max_queue_size})")
+    try: server.serve_forever()
+    except KeyboardInterrupt: print("\n正在关闭破译服务...")
+    finally:
+        server.server_close(); service.shutdown()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="单表代换本地破译服务")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数 (默认为CPU核数)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_MAX_QUEUE_SIZE, help="等待队列容量")
+    parser.add_argument("--table-precision", choices=ngram_tables.TABLE_PRECISIONS, default="float64",
+                        help="共享N-gram表的存储精度 (float32/int16 可缩小工作集)")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="破译结果缓存文件 (SQLite)")
+    parser.add_argument("--no-cache", action="store_true", help="不查询也不写入结果缓存")
+    parser.add_argument("--model", action="append", default=[], metavar="名称=目录/前缀[@版本]",
+                        help="额外注册的语言模型 (build_ngram_model 的输出)，可重复指定；solve 任务通过 model 参数选用")
+    args = parser.parse_args()
+    try: register_model_specs(args.model) # 启动前检查模型规格，错误时直接提示
+    except ValueError as e: parser.error(str(e))
+    run_server(args.host, args.port, args.workers, args.queue_size, args.table_precision, None if args.no_cache else args.cache_path, args.model)
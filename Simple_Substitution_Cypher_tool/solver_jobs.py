@@ -0,0 +1,165 @@
+# solver_jobs.py
+# 加密、解密与自动破译任务的统一执行入口，供本地破译服务等批处理调用方在工作进程中复用
+
+import time
+import string
+import sqlite3
+from cipher_logic import encrypt, decrypt, validate_key
+from auto_solver import solve_simulated_annealing, INITIAL_KEY_STRATEGIES
+from annealing_profiles import validate_fitness_weights
+from compiled_text import compile_text
+from language_models import resolve_model, get_model, register_model_specs
+from result_cache import DEFAULT_CACHE_PATH, get_result_cache
+import ngram_tables
+
+JOB_KINDS = ("encrypt", "decrypt", "solve")
+SOLVER_PARAM_NAMES = ("initial_temperature", "cooling_rate", "min_temperature", "max_iterations_per_run", "fitness_weights", "initial_key_strategy", "staged")
+PROGRESS_MIN_INTERVAL_SECONDS = 0.2 # 进度事件的最小上报间隔 (单轮结束事件不受限制)
+
+_WORKER_PROGRESS_QUEUE = None # 工作进程内：进度事件队列 (由 init_job_worker 设置)
+_WORKER_CANCELLED_JOBS = None # 工作进程内：已取消任务ID的共享容器 (由 init_job_worker 设置)
+_RESULT_CACHE_PATH = DEFAULT_CACHE_PATH # 工作进程内：破译结果缓存文件，None 表示不使用缓存 (由 init_job_worker 设置)
+
+def init_job_worker(shared_tables_name=None, progress_queue=None, cancelled_jobs=None, cache_path=DEFAULT_CACHE_PATH, model_specs=()):
+    """进程池 initializer：附加共享N-gram表，注册 model_specs 中的语言模型 (见 language_models.parse_model_spec)，
+    并记录进度队列、取消列表与结果缓存路径供 run_job_in_worker 使用。"""
+    global _WORKER_PROGRESS_QUEUE, _WORKER_CANCELLED_JOBS, _RESULT_CACHE_PATH
+    ngram_tables.init_solver_worker(shared_tables_name)
+    register_model_specs(model_specs)
+    _WORKER_PROGRESS_QUEUE = progress_queue
+    _WORKER_CANCELLED_JOBS = cancelled_jobs
+    _RESULT_CACHE_PATH = cache_path
+
+def run_job_in_worker(job_id, kind, params):
+    """在已初始化的工作进程中执行任务，进度事件写入共享进度队列。"""
+    progress_sink = _WORKER_PROGRESS_QUEUE.put if _WORKER_PROGRESS_QUEUE is not None else None
+    return run_job(job_id, kind, params, progress_sink=progress_sink, cancelled_jobs=_WORKER_CANCELLED_JOBS, cache_path=_RESULT_CACHE_PATH)
+
+def _convert_param(params, name, convert, is_valid, requirement):
+    """把 params[name] (存在且不为 None 时) 转换为数值并检查取值范围，非法时抛出 ValueError。"""
+    if params.get(name) is None: return
+    value = params[name]
+    try:
+        if isinstance(value, bool): raise TypeError # JSON 的 true/false 不算数值
+        converted = convert(value)
+        if convert is int and converted != float(value): raise ValueError # 拒绝 2.5 这类非整数
+    except (TypeError, ValueError, OverflowError): raise ValueError(f"{name} 必须是{requirement}。")
+    if not is_valid(converted): raise ValueError(f"{name} 必须是{requirement}。")
+    params[name] = converted
+
+def validate_job_params(kind, params):
+    """提交前的轻量校验 (不加载模型)，返回规范化后的参数副本；非法时抛出 ValueError。
+    检查任务类型、参数类型、solve 任务的模型名是否已注册，并把数值参数、fitness_weights 与锁定映射转换为规范形式，
+    使非法输入在提交时即被拒绝，而不是排队后在工作进程中失败。"""
+    if kind not in JOB_KINDS: raise ValueError(f"未知任务类型: '{kind}'。")
+    if not isinstance(params, dict): raise ValueError("params 必须是JSON对象。")
+    params = dict(params)
+    if kind in ("encrypt", "decrypt"):
+        if not isinstance(params.get("text", ""), str): raise ValueError("text 必须是字符串。")
+        if not isinstance(params.get("key", ""), str) or not validate_key(params.get("key", "").strip().lower()):
+            raise ValueError("无效密钥。密钥必须是26个不同的小写字母的排列。")
+        return params
+    if not isinstance(params.get("ciphertext", ""), str): raise ValueError("ciphertext 必须是字符串。")
+    model_name = params.get("model")
+    if model_name is not None:
+        if not isinstance(model_name, str): raise ValueError("model 必须是已注册的语言模型名。")
+        get_model(model_name) # 未注册时抛出 ValueError
+    if params.get("user_locked_mappings") is not None:
+        if not isinstance(params["user_locked_mappings"], dict): raise ValueError("user_locked_mappings 必须是 {密文字母: 明文字母} 形式的对象。")
+        params["user_locked_mappings"] = parse_locked_mappings(params["user_locked_mappings"])
+    _convert_param(params, "num_reruns", int, lambda value: value > 0, "正整数")
+    _convert_param(params, "time_budget_seconds", float, lambda value: value > 0, "正数")
+    _convert_param(params, "initial_temperature", float, lambda value: value > 0, "正数")
+    _convert_param(params, "min_temperature", float, lambda value: value > 0, "正数")
+    _convert_param(params, "cooling_rate", float, lambda value: 0 < value < 1, "(0, 1) 之间的数")
+    _convert_param(params, "max_iterations_per_run", int, lambda value: value > 0, "正整数")
+    if params.get("initial_temperature") is not None and params.get("min_temperature") is not None and params["initial_temperature"] <= params["min_temperature"]:
+        raise ValueError("initial_temperature 必须高于 min_temperature。")
+    if params.get("fitness_weights") is not None:
+        merged_weights = validate_fitness_weights(params["fitness_weights"]) # 名称未知或数值非法时抛出 ValueError
+        params["fitness_weights"] = {name: merged_weights[name] for name in params["fitness_weights"]}
+    if params.get("initial_key_strategy") is not None and params["initial_key_strategy"] not in INITIAL_KEY_STRATEGIES:
+        raise ValueError(f"未知的初始密钥策略: '{params['initial_key_strategy']}'。可选: {', '.join(INITIAL_KEY_STRATEGIES)}。")
+    for name in ("staged", "use_cache"):
+        if params.get(name) is not None and not isinstance(params[name], bool): raise ValueError(f"{name} 必须是 true 或 false。")
+    return params
+
+def parse_locked_mappings(raw_mappings):
+    """校验并规范化锁定映射 {密文字母: 明文字母}，返回 {密文大写: 明文小写}；非法时抛出 ValueError。"""
+    locked_map = {}
+    for cipher_char, plain_char in (raw_mappings or {}).items():
+        if not (isinstance(cipher_char, str) and isinstance(plain_char, str) and len(cipher_char) == 1 and len(plain_char) == 1
+                and cipher_char.upper() in string.ascii_uppercase and plain_char.lower() in string.ascii_lowercase):
+            raise ValueError(f"锁定映射格式错误: '{cipher_char}={plain_char}'。")
+        if plain_char.lower() in locked_map.values(): raise ValueError(f"明文 '{plain_char.lower()}' 被多个不同密文锁定。")
+        locked_map[cipher_char.upper()] = plain_char.lower()
+    return locked_map
+
+def run_job(job_id, kind, params, progress_sink=None, cancelled_jobs=None, cache_path=DEFAULT_CACHE_PATH):
+    """执行一个任务并返回结果字典。
+    参数:
+        kind (str): 'encrypt' / 'decrypt' 需要 text 与 key；'solve' 需要 ciphertext，可选 user_locked_mappings、
+                    solve_simulated_annealing 的退火参数与 fitness_weights (缺省时按密文长度取自退火档案)、initial_key_strategy (初始密钥策略)、staged (是否分阶段求解，缺省时按长度自动选择)、num_reruns (轮次)、time_budget_seconds (时间预算)
+                    model (已注册的语言模型名，缺省为英文) 与 use_cache (默认 True：先查结果缓存，同一配置下已至少运行 num_reruns 轮的结果直接返回，
+                    stop_reason 为 "cached"；完整结束的任务写入缓存)。
+        progress_sink (callable): 接收进度事件字典的回调，可为 None。
+        cancelled_jobs: 支持 `in` 判断的容器，job_id 出现在其中时任务在下一个检查点终止。
+        cache_path (str): 破译结果缓存文件，None 表示不使用缓存。
+    """
+    if kind in ("encrypt", "decrypt"):
+        key = str(params.get("key", "")).strip().lower()
+        if not validate_key(key): raise ValueError("无效密钥。密钥必须是26个不同的小写字母的排列。")
+        operation = encrypt if kind == "encrypt" else decrypt
+        return {"text": operation(str(params.get("text", "")), key)}
+    if kind != "solve": raise ValueError(f"未知任务类型: '{kind}'。")
+
+    ciphertext = compile_text(str(params.get("ciphertext", ""))) # 各轮共用同一预编译密文
+    if not ciphertext.codes: raise ValueError("密文中没有可破译的字母。")
+    locked_mappings = parse_locked_mappings(params.get("user_locked_mappings"))
+    model = resolve_model(params.get("model")) # 未注册的模型名在此抛出 ValueError
+    solver_kwargs = {name: params[name] for name in SOLVER_PARAM_NAMES if params.get(name) is not None}
+    num_reruns = int(params.get("num_reruns", 1))
+    if num_reruns <= 0: raise ValueError("执行轮次必须是一个正整数。")
+    time_budget = params.get("time_budget_seconds")
+    deadline = time.monotonic() + float(time_budget) if time_budget else None
+    result_cache = get_result_cache(cache_path) if params.get("use_cache", True) else None
+    if result_cache is not None:
+        try: cached = result_cache.lookup(ciphertext, locked_mappings, model, solver_kwargs, min_runs=num_reruns) # 轮次少于本次要求的条目不算命中
+        except sqlite3.Error as e:
+            print(f"结果缓存警告：查询失败 ({e})。"); cached = None
+        if cached is not None:
+            return {"key": cached["key"], "plaintext": cached["plaintext"], "score": cached["score"], "runs_completed": 0,
+                    "stop_reason": "cached", "cached_runs_completed": cached["runs_completed"]}
+
+    def is_cancelled(): return cancelled_jobs is not None and job_id in cancelled_jobs
+    def should_stop(): return is_cancelled() or (deadline is not None and time.monotonic() >= deadline)
+
+    best_key, best_text, best_score = "", "", -float('inf')
+    runs_completed = 0; last_progress_time = 0.0
+    for run_num in range(1, num_reruns + 1):
+        if should_stop(): break
+
+        def report_progress(key_str, decrypted_text, score, iteration, is_final_for_run, status_message, run_num=run_num):
+            nonlocal last_progress_time
+            now = time.monotonic()
+            if not is_final_for_run and now - last_progress_time < PROGRESS_MIN_INTERVAL_SECONDS: return
+            last_progress_time = now
+            progress_sink({"job_id": job_id, "run": run_num, "num_reruns": num_reruns, "iteration": iteration,
+                           "score": score, "key": key_str, "final_for_run": is_final_for_run, "message": status_message})
+
+        run_key, run_text, run_score = solve_simulated_annealing(
+            ciphertext, locked_mappings,
+            status_callback=report_progress if progress_sink else None,
+            stop_check=should_stop, model=model, **solver_kwargs)
+        runs_completed += 1
+        if run_score > best_score: best_key, best_text, best_score = run_key, run_text, run_score
+
+    if is_cancelled(): stop_reason = "cancelled"
+    elif runs_completed < num_reruns or (deadline is not None and time.monotonic() >= deadline): stop_reason = "time_budget_exhausted"
+    else: stop_reason = "completed"
+    if result_cache is not None and stop_reason == "completed": # 被取消或超出时间预算的结果不代表完整的破译，不写入缓存
+        try: result_cache.store(ciphertext, best_key, best_score, runs_completed, locked_mappings, model,
+                                metadata={"num_reruns": num_reruns, "solver_params": solver_kwargs}, solver_params=solver_kwargs)
+        except sqlite3.Error as e: print(f"结果缓存警告：写入失败 ({e})。")
+    return {"key": best_key, "plaintext": best_text, "score": best_score if runs_completed else None,
+            "runs_completed": runs_completed, "stop_reason": stop_reason}
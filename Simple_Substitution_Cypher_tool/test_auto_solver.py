@@ -0,0 +1,35 @@
+# test_auto_solver.py
+# 自动破译的回归测试 (python -m unittest test_auto_solver，在本目录下运行)
+
+import random
+import unittest
+
+import ngram_tables
+from auto_solver import solve_simulated_annealing
+from benchmark import make_workload
+
+class WarmStartTemperatureTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        ngram_tables.ensure_fitness_tables_loaded()
+        cls.ciphertext = make_workload(1, 595, seed=3)[0][2]
+
+    def _run_iterations(self, **kwargs):
+        """执行一轮退火，返回完成的迭代次数。"""
+        iterations = []
+        def status_callback(key_str, decrypted_text, score, iteration, is_final_for_run, status_message):
+            if is_final_for_run: iterations.append(iteration)
+        random.seed(0)
+        solve_simulated_annealing(self.ciphertext, status_callback=status_callback, **kwargs)
+        return iterations[-1]
+
+    def test_warm_start_with_high_explicit_min_temperature_still_anneals(self):
+        # 档案初温乘热启动比例后低于显式末温时，初温应被抬高到末温之上，而不是在第0次迭代就停止并返回未经退火的热启动密钥
+        self.assertEqual(self._run_iterations(initial_key_strategy="warm", min_temperature=0.05, max_iterations_per_run=600), 600)
+
+    def test_explicit_initial_temperature_not_above_min_temperature_raises(self):
+        with self.assertRaises(ValueError):
+            solve_simulated_annealing(self.ciphertext, initial_temperature=0.01, min_temperature=0.05, max_iterations_per_run=10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+# tune_annealing.py
+# 退火参数调优工具：在可复现的合成测试集上随机搜索退火日程与适应度权重，
+# 以期望求解时间 (time-to-solution) 为目标，为每个密文长度档选出最优档案并写入 annealing_profiles.json；
+# --initial-key-strategy warm 时只调优热启动轮次的初温比例 (warm_start_temperature_scale)，档案其余部分保持不变
+
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import ngram_tables
+from auto_solver import solve_simulated_annealing, INITIAL_KEY_STRATEGIES
+from compiled_text import compile_text
+from benchmark import make_workload, letter_recovery_rate
+from annealing_profiles import (PROFILES_FILE_PATH, LENGTH_BUCKETS, FITNESS_WEIGHT_NAMES, DEFAULT_PROFILE,
+                                load_profiles, save_profiles, validate_profile)
+
+SOLVED_RECOVERY_THRESHOLD = 0.9 # 字母恢复率达到此值即视为该轮破译成功
+BUCKET_SAMPLE_LETTERS = {150: 100, 400: 250, 1000: 600, 2500: 1500, None: 3000} # 各长度档调优时使用的明文字母数
+SCHEDULE_ITERATIONS_RANGE = (1000, 40000) # 退火日程长度 (从初温降到末温的迭代次数) 的搜索范围
+INITIAL_TEMPERATURE_RANGE = (0.1, 10.0) # 单次交换带来的适应度变化通常在 0.01~0.2 量级
+MIN_TEMPERATURE_RANGE = (0.0005, 0.05)
+WEIGHT_PERTURBATION_SIGMA = 0.35 # 适应度权重的对数正态扰动幅度
+WARM_START_TEMPERATURE_SCALE_RANGE = (0.01, 1.0) # 热启动初温比例的搜索范围 (下限另受 min_temperature 约束)
+DEFAULT_CANDIDATES = 12
+DEFAULT_TRIALS = 6
+DEFAULT_RUN_TIME_LIMIT_SECONDS = 30.0
+
+def _log_uniform(rng, low, high):
+    return math.exp(rng.uniform(math.log(low), math.log(high)))
+
+def sample_candidate(rng, base_profile):
+    """在 base_profile 附近随机生成一个候选档案：日程参数在搜索范围内按对数均匀采样，权重做对数正态扰动。"""
+    schedule_iterations = round(_log_uniform(rng, *SCHEDULE_ITERATIONS_RANGE))
+    initial_temperature = _log_uniform(rng, *INITIAL_TEMPERATURE_RANGE)
+    min_temperature = min(_log_uniform(rng, *MIN_TEMPERATURE_RANGE), initial_temperature / 10)
+    weights = {name: base_profile["fitness_weights"][name] * math.exp(rng.gauss(0, WEIGHT_PERTURBATION_SIGMA)) for name in FITNESS_WEIGHT_NAMES}
+    return validate_profile({
+        "initial_temperature": initial_temperature, "min_temperature": min_temperature,
+        "cooling_rate": (min_temperature / initial_temperature) ** (1.0 / schedule_iterations), # 恰好在 schedule_iterations 步降到末温
+        "max_iterations_per_run": schedule_iterations, "fitness_weights": weights})
+
+def sample_warm_start_candidate(rng, base_profile):
+    """在 base_profile 上只改动热启动初温比例，按对数均匀采样 (保证热启动初温高于末温)。"""
+    low = max(WARM_START_TEMPERATURE_SCALE_RANGE[0], 2 * base_profile["min_temperature"] / base_profile["initial_temperature"])
+    return validate_profile(dict(base_profile, warm_start_temperature_scale=_log_uniform(rng, min(low, 1.0), WARM_START_TEMPERATURE_SCALE_RANGE[1])))
+
+def evaluate_candidate(profile, workload, seed=0, run_time_limit=DEFAULT_RUN_TIME_LIMIT_SECONDS, initial_key_strategy="random"):
+    """用候选档案对测试集中每条密文各执行一轮退火，返回指标字典。
+    time_to_solution = 总耗时 / 成功轮数，即反复重启直到成功的期望耗时；没有成功轮次时为无穷大。"""
+    total_seconds = 0.0; successes = 0; recovery_sum = 0.0
+    schedule_kwargs = {name: profile[name] for name in ("initial_temperature", "cooling_rate", "min_temperature", "max_iterations_per_run")}
+    if initial_key_strategy == "warm": schedule_kwargs["initial_temperature"] *= profile["warm_start_temperature_scale"]
+    for trial_index, (plaintext, _, ciphertext) in enumerate(workload):
+        random.seed(seed * 100003 + trial_index)
+        compiled_ciphertext = compile_text(ciphertext)
+        start_time = time.perf_counter(); deadline = start_time + run_time_limit
+        _, decrypted_text, _ = solve_simulated_annealing(
+            compiled_ciphertext, fitness_weights=profile["fitness_weights"], initial_key_strategy=initial_key_strategy,
+            stop_check=lambda: time.perf_counter() >= deadline, **schedule_kwargs)
+        total_seconds += time.perf_counter() - start_time
+        recovery = letter_recovery_rate(plaintext, decrypted_text)
+        recovery_sum += recovery
+        if recovery >= SOLVED_RECOVERY_THRESHOLD: successes += 1
+    return {"runs": len(workload), "successes": successes, "mean_seconds": total_seconds / len(workload),
+            "mean_recovery": recovery_sum / len(workload),
+            "time_to_solution": total_seconds / successes if successes else float('inf')}
+
+def _candidate_rank(metrics):
+    """排序键：期望求解时间越短越好，同为无穷大时比较平均恢复率。"""
+    return (metrics["time_to_solution"], -metrics["mean_recovery"])
+
+def tune_bucket(max_letters, num_candidates=DEFAULT_CANDIDATES, num_trials=DEFAULT_TRIALS, seed=0,
+                run_time_limit=DEFAULT_RUN_TIME_LIMIT_SECONDS, executor=None, progress_callback=None, profiles_path=PROFILES_FILE_PATH,
+                initial_key_strategy="random"):
+    """为一个长度档调优，返回 (最优档案, 最优指标)。候选包括内置默认档案、profiles_path 中的当前档案与随机采样的档案。
+    initial_key_strategy 为 "warm" 时候选均为当前档案，只有热启动初温比例不同 (含当前比例与不降温的 1.0)，以热启动轮次评估。"""
+    sample_letters = BUCKET_SAMPLE_LETTERS.get(max_letters, 3000)
+    workload = make_workload(num_trials, sample_letters, seed=seed + sample_letters)
+    current_profile = dict(load_profiles(profiles_path)).get(max_letters, validate_profile(DEFAULT_PROFILE))
+    rng = random.Random(seed * 7919 + sample_letters)
+    if initial_key_strategy == "warm":
+        candidates = [current_profile, validate_profile(dict(current_profile, warm_start_temperature_scale=1.0))]
+        sampler = sample_warm_start_candidate
+    else:
+        candidates = [validate_profile(DEFAULT_PROFILE), current_profile]
+        sampler = sample_candidate
+    candidates += [sampler(rng, current_profile) for _ in range(max(num_candidates - len(candidates), 0))]
+
+    if executor is not None:
+        futures = [executor.submit(evaluate_candidate, candidate, workload, seed, run_time_limit, initial_key_strategy) for candidate in candidates]
+        results = []
+        for index, future in enumerate(futures):
+            results.append(future.result())
+            if progress_callback: progress_callback(max_letters, index + 1, len(candidates), results[-1])
+    else:
+        results = []
+        for index, candidate in enumerate(candidates):
+            results.append(evaluate_candidate(candidate, workload, seed, run_time_limit, initial_key_strategy))
+            if progress_callback: progress_callback(max_letters, index + 1, len(candidates), results[-1])
+    best_index = min(range(len(candidates)), key=lambda index: _candidate_rank(results[index]))
+    best_metrics = dict(results[best_index], sample_letters=sample_letters)
+    return candidates[best_index], best_metrics
+
+def tune_profiles(buckets=LENGTH_BUCKETS, num_candidates=DEFAULT_CANDIDATES, num_trials=DEFAULT_TRIALS, seed=0,
+                  run_time_limit=DEFAULT_RUN_TIME_LIMIT_SECONDS, num_workers=1, output_path=PROFILES_FILE_PATH, progress_callback=None,
+                  initial_key_strategy="random"):
+    """依次调优指定长度档，与现有档案合并后写入 output_path，返回写入的条目列表。未调优的档保留原有的调优信息；
+    热启动调优的结果记录在条目的 warm_start 字段中，不覆盖随机起点调优的指标。"""
+    entries_by_bucket = {entry["max_letters"]: entry for entry in _load_entries(output_path)}
+    executor = None
+    if num_workers > 1:
+        executor = ProcessPoolExecutor(max_workers=num_workers, initializer=ngram_tables.init_solver_worker)
+    try:
+        for max_letters in buckets:
+            profile, metrics = tune_bucket(max_letters, num_candidates, num_trials, seed, run_time_limit, executor, progress_callback,
+                                           output_path, initial_key_strategy)
+            tuning_info = {"metrics": metrics, "tuned_at": datetime.date.today().isoformat(),
+                           "candidates": num_candidates, "trials": num_trials, "seed": seed}
+            if initial_key_strategy == "warm":
+                entry = entries_by_bucket.setdefault(max_letters, {"max_letters": max_letters})
+                entry["profile"] = profile; entry["warm_start"] = tuning_info
+            else: # 重新调优后原有的热启动调优信息不再适用 (采样的候选使用默认初温比例)
+                entries_by_bucket[max_letters] = dict({"max_letters": max_letters, "profile": profile}, **tuning_info)
+    finally:
+        if executor is not None: executor.shutdown()
+    entries = sorted(entries_by_bucket.values(), key=lambda entry: float('inf') if entry["max_letters"] is None else entry["max_letters"])
+    for entry in entries: # JSON 不支持无穷大
+        for metrics in (entry.get("metrics"), entry.get("warm_start", {}).get("metrics")):
+            if metrics and metrics["time_to_solution"] is not None and math.isinf(metrics["time_to_solution"]): metrics["time_to_solution"] = None
+    save_profiles(entries, output_path)
+    return entries
+
+def _load_entries(filepath):
+    """读取档案文件中的原始条目 (保留调优信息)；文件缺失或无法解析时按已加载的档案构造条目。"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f: entries = json.load(f)["buckets"]
+        return [dict(entry, profile=validate_profile(entry["profile"])) for entry in entries]
+    except (OSError, ValueError, KeyError, TypeError):
+        return [{"max_letters": max_letters, "profile": profile} for max_letters, profile in load_profiles(filepath)]
+
+def _parse_bucket(value):
+    return None if value.lower() in ("none", "max", "inf") else int(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按密文长度档调优模拟退火参数与适应度权重")
+    parser.add_argument("--buckets", nargs="+", type=_parse_bucket, default=list(LENGTH_BUCKETS),
+                        help="要调优的长度档 (字母数上限，none 表示最长一档)")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES, help="每档评估的候选档案数")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS, help="每个候选在多少条合成密文上评估")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子 (决定测试集与候选)")
+    parser.add_argument("--run-time-limit", type=float, default=DEFAULT_RUN_TIME_LIMIT_SECONDS, help="单轮退火的时间上限 (秒)")
+    parser.add_argument("--workers", type=int, default=1, help="并行评估候选的进程数")
+    parser.add_argument("-o", "--output", default=PROFILES_FILE_PATH, help="档案文件路径")
+    parser.add_argument("--initial-key-strategy", choices=INITIAL_KEY_STRATEGIES, default="random",
+                        help="warm: 只调优热启动轮次的初温比例，档案其余参数不变")
+    args = parser.parse_args(argv)
+    for max_letters in args.buckets:
+        if max_letters not in LENGTH_BUCKETS: parser.error(f"未知的长度档: {max_letters}。可选: {LENGTH_BUCKETS}")
+
+    ngram_tables.init_solver_worker()
+    def report(max_letters, done, total, metrics):
+        tts = metrics["time_to_solution"]
+        print(f"[≤{max_letters if max_letters is not None else '∞'}] 候选 {done}/{total}: 成功 {metrics['successes']}/{metrics['runs']}，"
+              f"平均恢复率 {metrics['mean_recovery'] * 100:.1f}%，期望求解时间 {'∞' if math.isinf(tts) else f'{tts:.2f}s'}", file=sys.stderr)
+    entries = tune_profiles(args.buckets, args.candidates, args.trials, args.seed, args.run_time_limit, args.workers, args.output, report,
+                            args.initial_key_strategy)
+    for entry in entries:
+        profile = entry["profile"]
+        print(f"≤{entry['max_letters'] if entry['max_letters'] is not None else '∞'}: T0={profile['initial_temperature']:.3g} "
+              f"α={profile['cooling_rate']:.6f} Tmin={profile['min_temperature']:.3g} 迭代上限={profile['max_iterations_per_run']} "
+              f"热启动初温比例={profile['warm_start_temperature_scale']:.3g}")
+    print(f"已写出 {args.output}")
+
+if __name__ == '__main__':
+    main()